@@ -0,0 +1,199 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from Parser import ReturnParser, to_record
+from Metrics import METRICS
+
+# parser processes, regex parsing is CPU bound and one process is held by the GIL
+IMPORT_WORKERS = os.cpu_count() or 1
+# lines sent to a worker at a time, and rows per insert transaction
+CHUNK_LINES = 2000
+INSERT_BATCH_SIZE = 10000
+# JSONL objects: first of these keys holding the text
+TEXT_KEYS = ("text", "input", "description", "message")
+FORMATS = ("auto", "text", "jsonl")
+# a line with none of these is rejected: date and approved_flag alone are only defaults
+IDENTIFYING_COLUMNS = ("order_id", "product", "product_name", "return_reason")
+
+# one parser per worker process
+_parser = None
+
+
+def _parse_chunk(chunk, fmt, fields, available_columns):
+    """
+    worker: [(line number, raw line)] -> ([(line number, raw line, record)], [(line number, raw line, reason)])
+    """
+    global _parser
+    if _parser is None:
+        _parser = ReturnParser()
+
+    records = []
+    rejects = []
+    for line_no, raw in chunk:
+        text = raw
+        if fmt == "jsonl":
+            try:
+                value = json.loads(raw)
+            except ValueError as e:
+                rejects.append((line_no, raw, f"invalid JSON: {e}"))
+                continue
+            if isinstance(value, dict):
+                value = next((value[key] for key in TEXT_KEYS if isinstance(value.get(key), str)), None)
+            if not isinstance(value, str):
+                rejects.append((line_no, raw, f"no text field ({', '.join(TEXT_KEYS)})"))
+                continue
+            text = value
+
+        record = to_record(_parser.parse(text, fields), available_columns)
+        if not any(record.get(col) for col in IDENTIFYING_COLUMNS):
+            rejects.append((line_no, raw, "無法分析輸入: no order id, product or reason found"))
+        else:
+            records.append((line_no, raw, record))
+    return records, rejects
+
+
+class BulkImporter:
+    """
+    Bulk import of natural language return logs (one return per line)
+
+    The file is streamed in chunks of CHUNK_LINES lines, parsed by a process
+    pool (at most 2 chunks per worker in flight) and inserted in batches of
+    insert_batch_size rows while the workers parse the next chunks. Lines
+    that cannot be imported go to a JSONL reject file with the reason.
+    """
+    def __init__(self, agent, workers=IMPORT_WORKERS, chunk_lines=CHUNK_LINES, insert_batch_size=INSERT_BATCH_SIZE):
+        self.agent = agent
+        self.workers = max(1, workers or 1)
+        self.chunk_lines = chunk_lines
+        self.insert_batch_size = insert_batch_size
+
+    @staticmethod
+    def detect_format(path, fmt="auto"):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format: {fmt}")
+        if fmt != "auto":
+            return fmt
+        return "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "text"
+
+    def _chunks(self, f):
+        """[(line number, line)] per chunk, blank lines skipped"""
+        chunk = []
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            chunk.append((line_no, line))
+            if len(chunk) >= self.chunk_lines:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def import_file(self, path, fmt="auto", reject_path=None, job=None):
+        """
+        import every line of a text or JSONL file
+
+        reject_path: defaults to <path>.rejects.jsonl, only written when a line is rejected
+        job: optional Jobs.Job, progress follows the bytes read
+        """
+        if not os.path.exists(path):
+            return {"success": False, "error": f"File not found: {path}"}
+        fmt = self.detect_format(path, fmt)
+        if reject_path is None:
+            reject_path = f"{path}.rejects.jsonl"
+        if os.path.exists(reject_path):
+            os.remove(reject_path)
+
+        available_columns = self.agent.get_columns()
+        if not available_columns:
+            return {"success": False, "error": "No returns table, load a CSV first"}
+        fields = self.agent.parse_fields(available_columns)
+
+        self._lines = self._inserted = self._rejected = 0
+        self._reject_file = None
+        pending = []
+        start = time.perf_counter()
+        size = os.path.getsize(path) or 1
+
+        def handle(result):
+            records, rejects = result
+            self._lines += len(records) + len(rejects)
+            self._reject(reject_path, rejects)
+            pending.extend(records)
+            if len(pending) >= self.insert_batch_size:
+                self._insert(pending, reject_path)
+                pending.clear()
+
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                chunks = self._chunks(f)
+                if self.workers == 1:
+                    # no pool: nothing to gain from a single worker process
+                    for chunk in chunks:
+                        with METRICS.span("parse"):
+                            handle(_parse_chunk(chunk, fmt, fields, available_columns))
+                        self._progress(job, f.buffer.tell() / size)
+                else:
+                    from concurrent.futures import ProcessPoolExecutor
+                    # spawn, not fork: imports also run on JobQueue threads, and forking a
+                    # multithreaded process can deadlock the children
+                    with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                        in_flight = deque()
+                        for chunk in chunks:
+                            in_flight.append(pool.submit(_parse_chunk, chunk, fmt, fields, available_columns))
+                            # bounded read-ahead, results are taken in file order
+                            if len(in_flight) >= self.workers * 2:
+                                handle(in_flight.popleft().result())
+                                self._progress(job, f.buffer.tell() / size)
+                        while in_flight:
+                            handle(in_flight.popleft().result())
+            if pending:
+                self._insert(pending, reject_path)
+        finally:
+            if self._reject_file is not None:
+                self._reject_file.close()
+
+        elapsed = time.perf_counter() - start
+        print(f"Imported {self._inserted} of {self._lines} lines ({self._rejected} rejected) in {elapsed:.2f}s")
+        return {
+            "success": True,
+            "file": path,
+            "format": fmt,
+            "lines": self._lines,
+            "inserted": self._inserted,
+            "rejected": self._rejected,
+            "reject_file": reject_path if self._rejected else None,
+            "workers": self.workers,
+            "seconds": round(elapsed, 3),
+            "rate_per_sec": round(self._lines / elapsed, 1) if elapsed else None,
+            "records": self.agent.row_count(),
+        }
+
+    @staticmethod
+    def _progress(job, fraction):
+        if job is not None:
+            job.update(min(fraction, 1.0), "parsing")
+
+    def _insert(self, pending, reject_path):
+        try:
+            self.agent.insert_records([record for _, _, record in pending])
+            self._inserted += len(pending)
+        except Exception:
+            # find the rows that fail, the others still go in; rejects keep the source line
+            for line_no, raw, record in pending:
+                try:
+                    self.agent.insert_records([record])
+                    self._inserted += 1
+                except Exception as e:
+                    self._reject(reject_path, [(line_no, raw, f"insert failed: {e}")])
+
+    def _reject(self, reject_path, rejects):
+        if not rejects:
+            return
+        if self._reject_file is None:
+            self._reject_file = open(reject_path, "w", encoding="utf-8")
+        for line_no, raw, reason in rejects:
+            self._reject_file.write(json.dumps({"line": line_no, "input": raw, "reason": reason}, ensure_ascii=False) + "\n")
+        self._rejected += len(rejects)
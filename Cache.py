@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+
+class FileCache:
+    """
+    On-disk LRU cache of generated files (reports, exports), keyed by data version
+    """
+    def __init__(self, cache_dir, max_entries=8, suffix=""):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, *parts):
+        """
+        stable key for the data version and the options that shape the file
+        """
+        raw = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + self.suffix, base + ".json"
+
+    def get(self, key):
+        """
+        (cached file path, metadata) or None
+        """
+        file_path, meta_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                # mark as recently used
+                os.utime(meta_path)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            if not os.path.exists(file_path):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return file_path, meta
+
+    def put(self, key, source_path, meta=None, move=False):
+        """
+        copy a generated file into the cache, returns the cached path
+        
+        move: the file was written in cache_dir, rename it instead of copying
+        """
+        file_path, meta_path = self._paths(key)
+        if move:
+            os.replace(source_path, file_path)
+        else:
+            self._write_replace(file_path, lambda tmp: shutil.copyfile(source_path, tmp))
+        self._write_replace(meta_path, lambda tmp: self._write_meta(tmp, meta))
+        self.evict()
+        return file_path
+
+    def _write_replace(self, path, write):
+        """
+        write(temp path) to a temp file of its own in cache_dir, then rename it to path:
+        readers never see half a file, writers of the same key never share a temp file
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @staticmethod
+    def _write_meta(path, meta):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(meta or {}, f, default=str)
+
+    def evict(self):
+        """
+        drop the least recently used entries beyond max_entries
+        """
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".json"):
+                    path = os.path.join(self.cache_dir, name)
+                    try:
+                        entries.append((os.path.getmtime(path), name[:-len(".json")]))
+                    except OSError:
+                        pass
+            entries.sort(reverse=True)
+            for _, key in entries[self.max_entries:]:
+                for path in self._paths(key):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def stats(self):
+        entries = sum(1 for name in os.listdir(self.cache_dir) if name.endswith(".json"))
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "max_entries": self.max_entries}
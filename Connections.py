@@ -0,0 +1,170 @@
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# applied to every connection, readers and the writer
+CONNECTION_PRAGMAS = {
+    "cache_size": -16384,     # 16 MB page cache per connection
+    "mmap_size": 268435456,   # 256 MB memory-mapped reads
+    "temp_store": 2,          # MEMORY
+}
+
+# writer only: WAL lets readers run while a write is in progress,
+# synchronous NORMAL is durable across application crashes in WAL mode
+WRITER_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+}
+
+READ_POOL_SIZE = max(2, min(8, os.cpu_count() or 2))
+BUSY_TIMEOUT_MS = 5000
+
+
+class ConnectionManager:
+    """
+    SQLite connections of one database: a pool of read-only connections and a single writer
+
+    with db.reader() as conn: ...   # any number of threads, up to pool_size at once
+    with db.writer() as conn: ...   # one thread at a time, rolled back on error
+    with db.scan_reader() as conn: ...   # long scans, a connection of their own
+    """
+    def __init__(self, db_path, pool_size=READ_POOL_SIZE, busy_timeout=BUSY_TIMEOUT_MS, pragmas=None):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self.pragmas = dict(CONNECTION_PRAGMAS, **(pragmas or {}))
+
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._pool_lock = threading.Lock()
+        # readers handed out since the last close()
+        self._live = set()
+        # sqlite3 trace callback installed on every connection handed out (profiling), None: off
+        self.trace_callback = None
+
+    def _connect(self, read_only=False):
+        if read_only:
+            uri = pathlib.Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=self.busy_timeout / 1000, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout / 1000, check_same_thread=False)
+            for pragma, value in WRITER_PRAGMAS.items():
+                conn.execute(f"PRAGMA {pragma} = {value}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def _writer_connection(self):
+        # the writer also creates the database file and switches it to WAL
+        if self._writer is None:
+            self._writer = self._connect()
+        return self._writer
+
+    @contextmanager
+    def writer(self):
+        """
+        the single write connection; re-entrant within a thread
+        """
+        with self._writer_lock:
+            conn = self._writer_connection()
+            conn.set_trace_callback(self.trace_callback)
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def reader(self):
+        """
+        a read-only connection from the pool, waits up to busy_timeout when all are in use
+        """
+        conn = self._acquire()
+        conn.set_trace_callback(self.trace_callback)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if conn in self._live:
+                self._readers.put(conn)
+            else:
+                # opened before close()
+                conn.close()
+
+    @contextmanager
+    def scan_reader(self):
+        """
+        a read-only connection outside the pool, closed afterwards
+        
+        For scans that hold their connection for long (streamed reports, CSV exports):
+        however many run at once, the pool stays free for interactive reads.
+        """
+        if self._writer is None:
+            # make sure the file exists and is in WAL mode first
+            with self._writer_lock:
+                self._writer_connection()
+        conn = self._connect(read_only=True)
+        conn.set_trace_callback(self.trace_callback)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _acquire(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._pool_lock:
+            create = self._reader_count < self.pool_size
+            if create:
+                self._reader_count += 1
+        if create:
+            try:
+                if self._writer is None:
+                    # make sure the file exists and is in WAL mode first
+                    with self._writer_lock:
+                        self._writer_connection()
+                conn = self._connect(read_only=True)
+                self._live.add(conn)
+                return conn
+            except Exception:
+                with self._pool_lock:
+                    self._reader_count -= 1
+                raise
+
+        try:
+            return self._readers.get(timeout=self.busy_timeout / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"no free read connection after {self.busy_timeout} ms")
+
+    def stats(self):
+        return {
+            "pool_size": self.pool_size,
+            "readers_open": self._reader_count,
+            "readers_idle": self._readers.qsize(),
+        }
+
+    def close(self):
+        """close every connection, readers still in use are closed when returned; reopens on next use"""
+        with self._pool_lock:
+            self._live = set()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._pool_lock:
+            self._reader_count = 0
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
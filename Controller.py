@@ -1,42 +1,328 @@
+import os
+import shutil
+import threading
 from Retrieval import RetrievalAgent
 from GenReport import ReportAgent
+from Cache import FileCache
+from Jobs import JobQueue
+from WriteQueue import GroupCommitQueue
+from BulkImport import BulkImporter, IMPORT_WORKERS
+from Metrics import METRICS
+from Profiler import RequestProfiler
+
+# generated reports are reused until the data changes
+REPORT_CACHE_DIR = ".report_cache"
+REPORT_CACHE_ENTRIES = 8
+# reports written at the same time, later submissions wait in the queue
+REPORT_WORKERS = 2
+# CSV exports, reused the same way
+EXPORT_CACHE_DIR = ".export_cache"
+EXPORT_CACHE_ENTRIES = 8
+# concurrent inserts are committed together: up to INSERT_BATCH_SIZE rows queued while the
+# previous commit ran (plus INSERT_WINDOW seconds of waiting) share a transaction;
+# "wait" answers after the commit, "enqueue" at once
+INSERT_BATCH_SIZE = 256
+INSERT_WINDOW = 0.0
+INSERT_DURABILITY = "wait"
+# actions handled by _dispatch; metrics record any other action name as "unknown",
+# so clients cannot add a histogram series per made-up name
+ACTIONS = (
+    "load_csv", "insert", "flush_inserts", "write_queue", "insert_batch", "import_nl", "import_submit",
+    "query", "query_page", "count", "value_counts", "aggregate", "trend", "snapshot_stats",
+    "check_rollups", "rebuild_rollups", "report", "report_submit", "report_status", "report_result",
+    "report_cancel", "report_cache", "export_csv", "export_cache", "profile", "metrics",
+)
 
 class Controller:
     """
     Controller - control the work of the two agents
+    
+    One Controller can be shared by every thread (Streamlit sessions):
+    reads borrow a connection from the read-only pool, writes go through
+    the single writer connection, and the caches are locked.
     """
     def __init__(self):
         print("Controller Ready")
         self.retrieval_agent = RetrievalAgent()
         self.report_agent = ReportAgent()
+        self.report_cache = FileCache(REPORT_CACHE_DIR, REPORT_CACHE_ENTRIES, ".xlsx")
+        self.export_cache = FileCache(EXPORT_CACHE_DIR, EXPORT_CACHE_ENTRIES)
+        self.jobs = JobQueue(REPORT_WORKERS)
+        # off unless RETURNS_PROFILE=1 or the "profile" action turns it on
+        self.profiler = RequestProfiler.from_env(self.retrieval_agent.db)
+        self.write_queue = GroupCommitQueue(self.retrieval_agent, INSERT_BATCH_SIZE, INSERT_WINDOW, self.profiler)
     
     def handle_request(self, action, data=None):
         """
-        Assign the request
+        Assign the request, timed per action in METRICS (errors included)
         """
         #print(f"\nController received request: {action}")
-        
+        name = action if action in ACTIONS else "unknown"
         try:
-            if action == "load_csv":
-                return self.retrieval_agent.load_csv(data)
-            
-            elif action == "insert":
-                return self.retrieval_agent.insert_return(data)
-            
-            elif action == "query":
-                return self.retrieval_agent.get_all_returns()
-            
-            elif action == "report":
-                all_data = self.retrieval_agent.get_all_returns()
-                return self.report_agent.create_report(all_data, data)
-            
-            else:
-                return {"Error"}
-                
+            with METRICS.action(name), self.profiler.request(action, data):
+                result = self._dispatch(action, data)
         except Exception as e:
             return {"Error": str(e)}
+        
+        if isinstance(result, (set, dict)) and "Error" in result or isinstance(result, dict) and result.get("success") is False:
+            # handled failures are returned, not raised
+            METRICS.error(name, "failed")
+        return result
+    
+    def _dispatch(self, action, data):
+        agent = self.retrieval_agent
+        
+        if action == "load_csv":
+            # data: csv path, or {"csv_path": ..., "mode": ..., "chunk_size": ..., "progress": ...}
+            if isinstance(data, dict):
+                return self.retrieval_agent.load_csv(**data)
+            return self.retrieval_agent.load_csv(data)
+        
+        elif action == "insert":
+            # data: text, or {"text": ..., "durability": "wait" | "enqueue"}
+            options = data if isinstance(data, dict) else {"text": data}
+            return self.write_queue.insert(options["text"], options.get("durability", INSERT_DURABILITY))
+        
+        elif action == "flush_inserts":
+            # wait for inserts queued with durability "enqueue"
+            self.write_queue.flush()
+            return self.write_queue.stats()
+        
+        elif action == "write_queue":
+            return self.write_queue.stats()
+        
+        elif action == "insert_batch":
+            return self.retrieval_agent.insert_many(data)
+        
+        elif action == "import_nl":
+            # data: file path, or {"path": ..., "format": "auto" | "text" | "jsonl", "reject_file": ..., "workers": ...}
+            return self.import_nl(data)
+        
+        elif action == "import_submit":
+            # same data as "import_nl", on the job pool; follow it with report_status / report_result
+            job_id = self.jobs.submit("import_nl", self._import_job, data)
+            return {"success": True, "job_id": job_id}
+        
+        # read actions are served from the snapshot cache until the data changes
+        elif action == "query":
+            # data: optional filters, e.g. {"store": ..., "date_from": ..., "date_to": ...}
+            if data:
+                filters = dict(data)
+                limit = filters.pop("limit", None)
+                return agent.snapshot((action, data), lambda: agent.query_returns(filters, limit))
+            return agent.snapshot(action, agent.get_all_returns)
+        
+        elif action == "query_page":
+            # data: {"filters": {...}, "cursor": ..., "page_size": ...}
+            data = data or {}
+            return agent.snapshot((action, data), lambda: agent.query_page(
+                data.get("filters"), data.get("cursor"), data.get("page_size", 50)
+            ))
+        
+        elif action == "count":
+            return agent.snapshot((action, data), lambda: agent.count_returns(data))
+        
+        elif action == "value_counts":
+            # data: {"column": ..., "filters": {...}}
+            return agent.snapshot((action, data), lambda: agent.value_counts(data["column"], data.get("filters")))
+        
+        elif action == "aggregate":
+            # data: optional filters
+            return agent.snapshot((action, data), lambda: agent.aggregate_returns(data))
+
+        elif action == "trend":
+            # data: {"period": "day" | "week" | "month", "dimension": None | "store" | "product" | "reason",
+            #        "last_days": ..., "date_from": ..., "date_to": ..., "filters": {...}}
+            options = data or {}
+            return agent.snapshot((action, data), lambda: agent.trend(
+                options.get("period", "week"), options.get("dimension"), options.get("last_days"),
+                options.get("date_from"), options.get("date_to"), options.get("filters")
+            ))
+
+        elif action == "snapshot_stats":
+            return agent.snapshot_stats()
+        
+        elif action == "check_rollups":
+            return self.retrieval_agent.check_rollups()
+        
+        elif action == "rebuild_rollups":
+            self.retrieval_agent.rebuild_rollups()
+            return self.retrieval_agent.check_rollups()
+        
+        elif action == "report":
+            # data: output file, or {"output_file": ..., "streaming": False}
+            return self.generate_report(data)
+        
+        elif action == "report_submit":
+            # same data as "report", runs on the job pool and returns at once
+            job_id = self.jobs.submit("report", self._report_job, data)
+            return {"success": True, "job_id": job_id}
+        
+        elif action == "report_status":
+            # data: job id, or None for every job
+            return self.jobs.status(data) if data else self.jobs.list()
+        
+        elif action == "report_result":
+            # data: job id, or {"job_id": ..., "timeout": seconds to wait}
+            options = data if isinstance(data, dict) else {"job_id": data}
+            return self.jobs.result(options["job_id"], options.get("timeout"))
+        
+        elif action == "report_cancel":
+            return self.jobs.cancel(data)
+        
+        elif action == "report_cache":
+            return self.report_cache.stats()
+        
+        elif action == "export_csv":
+            # data: None, or {"filters": {...}, "gzip": bool, "output_file": copy the export here}
+            return self.export_csv(data)
+        
+        elif action == "export_cache":
+            return self.export_cache.stats()
+        
+        elif action == "profile":
+            # data: None (status) / {"enabled": bool, "threshold_ms": ...}
+            options = data or {}
+            if options.get("enabled") is True:
+                self.profiler.enable(options.get("threshold_ms"))
+            elif options.get("enabled") is False:
+                self.profiler.disable()
+            elif "threshold_ms" in options:
+                self.profiler.threshold_ms = options["threshold_ms"]
+            return self.profiler.status()
+        
+        elif action == "metrics":
+            # data: None / {"format": "json" | "prometheus", "reset": True, "enabled": bool}
+            options = data or {}
+            if "enabled" in options:
+                METRICS.enabled = bool(options["enabled"])
+            if options.get("format") == "prometheus":
+                dump = METRICS.to_prometheus()
+            else:
+                dump = METRICS.to_dict()
+            if options.get("reset"):
+                METRICS.reset()
+            return dump
+        
+        else:
+            return {"Error"}
+    
+    def generate_report(self, data, job=None):
+        """
+        write the Excel report, job: the background Job when run from report_submit
+        """
+        options = data if isinstance(data, dict) else {"output_file": data}
+        output_file = options.get("output_file") or "report.xlsx"
+        streaming = options.get("streaming", True)
+        
+        # same data + same options -> same workbook, copy it from the cache
+        version = self.retrieval_agent.data_version()
+        key = self.report_cache.make_key("report", version, streaming)
+        cached = self.report_cache.get(key)
+        if cached:
+            cached_file, result = cached
+            shutil.copyfile(cached_file, output_file)
+            return dict(result, file=output_file, cached=True)
+        
+        # statistics come from SQLite, only the Raw Data sheet needs the rows
+        if job:
+            job.update(0.0, "aggregating")
+        analysis = self.retrieval_agent.snapshot(("aggregate", None), self.retrieval_agent.aggregate_returns)
+        if streaming:
+            columns, rows = self.retrieval_agent.iter_rows()
+            if job:
+                rows = self._track_rows(job, rows, analysis.get('total_returns') or 1)
+            with METRICS.span("excel"):
+                result = self.report_agent.create_report_streaming(rows, columns, analysis, output_file)
+        else:
+            # chunks straight from the cursor: the rows are never held twice (fetchall list + DataFrame)
+            all_data = self.retrieval_agent.read_frame(compact=False)
+            if job:
+                job.update(0.5, "writing workbook")
+            with METRICS.span("excel"):
+                result = self.report_agent.create_report(all_data, output_file, analysis)
+        
+        if job and job.cancelled():
+            # a cancelled job leaves no half written file behind
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            return {"success": False, "error": "cancelled"}
+        
+        if result.get("success") and os.path.exists(output_file):
+            # statistics and rows are read on separate connections: only cache the workbook
+            # under this version when no write landed while it was read
+            if self.retrieval_agent.data_version() == version:
+                self.report_cache.put(key, output_file, result)
+        return dict(result, cached=False)
+    
+    def export_csv(self, data=None):
+        """
+        CSV export of the (filtered) records, written on request and reused until the data changes
+        
+        returns {"success", "file", "rows", "bytes", "compressed", "cached"}; without output_file,
+        file is the cached export itself (read it, do not modify it)
+        """
+        options = data or {}
+        filters = options.get("filters") or None
+        compress = bool(options.get("gzip"))
+        
+        key = self.export_cache.make_key("export_csv", self.retrieval_agent.data_version(), filters, compress)
+        cached = self.export_cache.get(key)
+        if cached:
+            file_path, result = cached
+            result = dict(result, cached=True)
+        else:
+            # written next to the cache entries, then renamed into place
+            part = os.path.join(self.export_cache.cache_dir, f"{key}.{threading.get_ident()}.part")
+            try:
+                result = self.retrieval_agent.export_csv(part, filters, compress)
+                # cached under the version the rows were read at, which a write since the lookup may have changed
+                key = self.export_cache.make_key("export_csv", result.pop("data_version"), filters, compress)
+                file_path = self.export_cache.put(key, part, result, move=True)
+            finally:
+                if os.path.exists(part):
+                    os.remove(part)
+            result = dict(result, cached=False)
+        
+        if options.get("output_file"):
+            shutil.copyfile(file_path, options["output_file"])
+            file_path = options["output_file"]
+        return dict(result, file=file_path)
+    
+    def import_nl(self, data, job=None):
+        """
+        bulk import a natural language log file (one return per line), parsed across processes
+        """
+        options = data if isinstance(data, dict) else {"path": data}
+        importer = BulkImporter(self.retrieval_agent, options.get("workers") or IMPORT_WORKERS)
+        return importer.import_file(options["path"], options.get("format", "auto"), options.get("reject_file"), job)
+    
+    def _import_job(self, data, job=None):
+        with METRICS.action("import_job"):
+            return self.import_nl(data, job)
+    
+    def _report_job(self, data, job=None):
+        # jobs run outside handle_request, time them as their own action
+        with METRICS.action("report_job"):
+            return self.generate_report(data, job)
+    
+    def _track_rows(self, job, rows, total):
+        """
+        pass the row chunks through, reporting progress to the job
+        """
+        written = 0
+        for chunk in rows:
+            if job.cancelled():
+                # stop early, the workbook is closed normally and removed afterwards
+                return
+            job.update(0.95 * written / total, f"{written:,} / {total:,} rows")
+            yield chunk
+            written += len(chunk)
+        job.update(0.95, "saving workbook")
     
     def close(self):
         """Close database connections"""
+        self.write_queue.close()
+        self.jobs.shutdown()
         if self.retrieval_agent:
             self.retrieval_agent.close()
\ No newline at end of file
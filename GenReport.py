@@ -1,4 +1,8 @@
-import pandas as pd
+# pandas and openpyxl are imported by the methods that need them, not with the module
+from Parser import WEEKLY_TREND_DAYS
+
+# rows per worksheet in Excel, header included
+EXCEL_MAX_ROWS = 1048576
 
 class ReportAgent:
     """
@@ -8,6 +12,7 @@ class ReportAgent:
         if data is None or (hasattr(data, 'empty') and data.empty):
             return {}
         
+        import pandas as pd
         df = pd.DataFrame(data)
         total_returns = len(df)
         
@@ -41,7 +46,7 @@ class ReportAgent:
                 'min': df['cost'].min()
             }
         
-        return {
+        analysis = {
             "total_returns": total_returns,
             "by_product": product_stats,
             "by_category": category_stats,
@@ -50,27 +55,48 @@ class ReportAgent:
             "cost_analysis": cost_analysis,
             "recent_returns": data[:10] 
         }
+        
+        # weekly trend
+        if 'date' in df.columns:
+            analysis["weekly_trend"] = self.weekly_trend(df)
+        return analysis
     
-    def create_report(self, data, output_file="report.xlsx"):
+    def weekly_trend(self, df):
+        """
+        returns and cost per week (Monday first) of the last WEEKLY_TREND_DAYS days, oldest first
+        """
+        import pandas as pd
+        from Parser import date_days, day_to_date
+        days = date_days(df['date'])
+        cost = df['cost'] if 'cost' in df.columns else pd.Series(0.0, index=df.index)
+        frame = pd.DataFrame({'day': days, 'cost': cost.to_numpy()}, index=df.index).dropna(subset=['day'])
+        if frame.empty:
+            return []
+        start = frame['day'].max() - WEEKLY_TREND_DAYS + 1
+        frame = frame[frame['day'] >= start - (start + 3) % 7]
+        # 1970-01-01 was a Thursday
+        frame['week'] = frame['day'] - (frame['day'] + 3) % 7
+        weeks = frame.groupby('week').agg(returns=('day', 'size'), cost=('cost', 'sum'))
+        return [{"period": day_to_date(int(week)), "returns": int(row.returns), "cost": round(float(row.cost), 2)}
+                for week, row in weeks.iterrows()]
+    
+    def create_report(self, data, output_file="report.xlsx", analysis=None):
+        """
+        analysis: statistics already computed elsewhere (e.g. RetrievalAgent.aggregate_returns),
+                  analyze_data(data) is used when it is not given
+        """
         if data is None or (hasattr(data, 'empty') and data.empty):
             return {"Error": "沒有資料"}
         
-        analysis = self.analyze_data(data)
+        if not analysis:
+            analysis = self.analyze_data(data)
         
+        import pandas as pd
         try:
             # Excel
             with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
                 # Summary
-                summary_data = []
-                summary_data.append(['總退貨數', analysis['total_returns']])
-                summary_data.append(['產品種類', len(analysis['by_product'])])
-                summary_data.append(['涉及商店', len(analysis['by_store'])])
-                
-                if analysis['cost_analysis']:
-                    summary_data.append(['總成本', f"${analysis['cost_analysis']['total']:.2f}"])
-                    summary_data.append(['平均成本', f"${analysis['cost_analysis']['average']:.2f}"])
-                
-                summary_df = pd.DataFrame(summary_data, columns=['指標', '數值'])
+                summary_df = pd.DataFrame(self.summary_rows(analysis), columns=['指標', '數值'])
                 summary_df.to_excel(writer, sheet_name='Summary', index=False)
                 
                 # Raw Data
@@ -92,26 +118,132 @@ class ReportAgent:
                     ).sort_values('Count', ascending=False)
                     reason_df.to_excel(writer, sheet_name='Reason Analysis', index=False)
                 
+                # Weekly Trend
+                if analysis.get('weekly_trend'):
+                    trend_df = pd.DataFrame(self.trend_rows(analysis), columns=['Week', 'Returns', 'Cost'])
+                    trend_df.to_excel(writer, sheet_name='Weekly Trend', index=False)
+                
                 # Findings
                 findings = self.generate_findings(analysis)
                 findings_df = pd.DataFrame(findings, columns=['Findings'])
                 findings_df.to_excel(writer, sheet_name='Findings', index=False)
             
             # Summary
-            return {
-                "success": True,
-                "file": output_file,
-                "summary": {
-                    "total": analysis['total_returns'],
-                    "top_product": max(analysis['by_product'], key=analysis['by_product'].get) if analysis['by_product'] else None,
-                    "top_reason": max(analysis['by_reason'], key=analysis['by_reason'].get) if analysis['by_reason'] else None
-                }
-            }
+            return self.report_result(analysis, output_file)
             
         except Exception as e:
             print(f"   ✗ 生成報告時發生錯誤: {e}")
             return {"success": False, "error": str(e)}
     
+    def create_report_streaming(self, rows, columns, analysis, output_file="report.xlsx"):
+        """
+        same workbook as create_report, written with constant memory
+        
+        rows: iterable of row chunks (lists of tuples), e.g. fetchmany() batches of a SQLite cursor
+        columns: column names of the rows
+        analysis: the analysis dict (RetrievalAgent.aggregate_returns)
+        Raw Data is split over "Raw Data", "Raw Data 2", ... at Excel's row limit.
+        """
+        if not analysis or not analysis.get('total_returns'):
+            return {"Error": "沒有資料"}
+        
+        from openpyxl import Workbook
+        try:
+            # write-only workbook: rows go to disk as they are appended
+            workbook = Workbook(write_only=True)
+            
+            # Summary
+            sheet = workbook.create_sheet('Summary')
+            sheet.append(['指標', '數值'])
+            for row in self.summary_rows(analysis):
+                sheet.append(row)
+            
+            # Raw Data
+            sheet = None
+            sheet_rows = EXCEL_MAX_ROWS
+            sheet_count = 0
+            for chunk in rows:
+                for row in chunk:
+                    if sheet_rows >= EXCEL_MAX_ROWS:
+                        sheet_count += 1
+                        sheet = workbook.create_sheet('Raw Data' if sheet_count == 1 else f'Raw Data {sheet_count}')
+                        sheet.append(list(columns))
+                        sheet_rows = 1
+                    sheet.append(row)
+                    sheet_rows += 1
+            if sheet is None:
+                workbook.create_sheet('Raw Data').append(list(columns))
+            
+            # Product Analysis
+            if analysis['by_product']:
+                sheet = workbook.create_sheet('Product Analysis')
+                sheet.append(['Product', 'Returns Count'])
+                for row in sorted(analysis['by_product'].items(), key=lambda item: item[1], reverse=True):
+                    sheet.append(list(row))
+            
+            # Reason Analysis
+            if analysis['by_reason']:
+                sheet = workbook.create_sheet('Reason Analysis')
+                sheet.append(['Return Reason', 'Count'])
+                for row in sorted(analysis['by_reason'].items(), key=lambda item: item[1], reverse=True):
+                    sheet.append(list(row))
+            
+            # Weekly Trend
+            if analysis.get('weekly_trend'):
+                sheet = workbook.create_sheet('Weekly Trend')
+                sheet.append(['Week', 'Returns', 'Cost'])
+                for row in self.trend_rows(analysis):
+                    sheet.append(row)
+            
+            # Findings
+            sheet = workbook.create_sheet('Findings')
+            sheet.append(['Findings'])
+            for finding in self.generate_findings(analysis):
+                sheet.append([finding])
+            
+            workbook.save(output_file)
+            
+            # Summary
+            return self.report_result(analysis, output_file)
+            
+        except Exception as e:
+            print(f"   ✗ 生成報告時發生錯誤: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def summary_rows(self, analysis):
+        """
+        rows of the Summary sheet
+        """
+        summary_data = []
+        summary_data.append(['總退貨數', analysis['total_returns']])
+        summary_data.append(['產品種類', len(analysis['by_product'])])
+        summary_data.append(['涉及商店', len(analysis['by_store'])])
+        
+        if analysis['cost_analysis']:
+            summary_data.append(['總成本', f"${analysis['cost_analysis']['total']:.2f}"])
+            summary_data.append(['平均成本', f"${analysis['cost_analysis']['average']:.2f}"])
+        return summary_data
+    
+    def trend_rows(self, analysis):
+        """
+        rows of the Weekly Trend sheet: week start, returns, cost
+        """
+        return [[row['period'], row['returns'], row['cost']] for row in analysis['weekly_trend']]
+    
+    def report_result(self, analysis, output_file):
+        """
+        result dict returned for a written report
+        """
+        return {
+            "success": True,
+            "file": output_file,
+            "summary": {
+                "total": analysis['total_returns'],
+                "top_product": max(analysis['by_product'], key=analysis['by_product'].get) if analysis['by_product'] else None,
+                "top_reason": max(analysis['by_reason'], key=analysis['by_reason'].get) if analysis['by_reason'] else None
+            }
+        }
+    
     def generate_findings(self, analysis):
         findings = []
         
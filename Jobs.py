@@ -0,0 +1,171 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """
+    raised inside a job once it has been cancelled
+    """
+
+
+class Job:
+    """
+    One background job: state, progress and result
+    """
+    def __init__(self, job_id, name):
+        self.id = job_id
+        self.name = name
+        self.state = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    def update(self, progress=None, message=None):
+        """
+        called by the job itself; raises JobCancelled when cancel() was requested
+        """
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+        if progress is not None:
+            self.progress = min(max(progress, 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def _mark_cancelled(self):
+        self.state = "cancelled"
+        self.finished_at = time.time()
+
+    def finished(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def status(self):
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "state": self.state,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "queued_sec": (self.started_at or end) - self.submitted_at,
+            "elapsed_sec": end - self.started_at if self.started_at else 0.0,
+        }
+
+
+class JobQueue:
+    """
+    Bounded worker pool for long running jobs (reports), polled by id
+    """
+    def __init__(self, max_workers=2, max_jobs=100):
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, name, fn, *args, **kwargs):
+        """
+        queue fn(*args, job=job, **kwargs), returns the job id at once
+        """
+        with self._lock:
+            job = Job(f"{name}-{next(self._ids)}", name)
+            self._jobs[job.id] = job
+            self._trim()
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled():
+            # cancelled after the worker took it, before it started
+            job._mark_cancelled()
+            return
+        job.state = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args, job=job, **kwargs)
+            if job.cancelled():
+                job.state = "cancelled"
+            elif isinstance(job.result, dict) and (job.result.get("success") is False or "Error" in job.result):
+                job.state = "failed"
+                job.error = job.result.get("error") or job.result.get("Error")
+            else:
+                job.state = "done"
+                job.progress = 1.0
+        except JobCancelled:
+            job.state = "cancelled"
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def _trim(self):
+        # keep the newest max_jobs, only finished jobs are dropped
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished()]
+        for job_id in finished[:max(len(self._jobs) - self.max_jobs, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"unknown job: {job_id}")
+        return job
+
+    def status(self, job_id):
+        return self.get(job_id).status()
+
+    def result(self, job_id, timeout=None):
+        """
+        the job's result once finished; timeout=None returns the status of an unfinished job
+        """
+        job = self.get(job_id)
+        if timeout is not None and not job.finished():
+            try:
+                job.future.result(timeout)
+            except Exception:
+                pass
+        if job.state == "done":
+            return job.result
+        if job.finished():
+            return {"success": False, "error": job.error or job.state, "state": job.state}
+        return job.status()
+
+    def cancel(self, job_id):
+        """
+        queued jobs never start, running jobs stop at their next progress update
+        """
+        job = self.get(job_id)
+        if job.finished():
+            return job.status()
+        job._cancel.set()
+        if job.future.cancel():
+            job._mark_cancelled()
+        return job.status()
+
+    def list(self):
+        with self._lock:
+            return [job.status() for job in self._jobs.values()]
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job in list(self._jobs.values()):
+                if not job.finished():
+                    job._cancel.set()
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+        # jobs whose future was cancelled never ran
+        for job in list(self._jobs.values()):
+            if job.state == "queued":
+                job._mark_cancelled()
@@ -1,35 +1,142 @@
 import sqlite3
-import pandas as pd
 from datetime import datetime
+import os
 import re
-import threading
+import time
+from Connections import ConnectionManager, READ_POOL_SIZE, BUSY_TIMEOUT_MS
+from Metrics import METRICS
+from Parser import date_day, date_days
+
+# connection settings used while bulk loading, restored afterwards
+LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "cache_size": -65536,   # 64 MB page cache
+    "temp_store": 2,        # MEMORY
+}
+
+# load_csv modes
+LOAD_MODES = ("replace", "append", "upsert")
+
+# secondary indexes on the commonly filtered columns, name -> columns
+# (created only when the table has all of the columns)
+# date ranges are filtered on date_day, the day number kept next to the date text
+INDEXES = {
+    "idx_returns_store_day": ("store_name", "date_day"),
+    "idx_returns_date_day": ("date_day",),
+    "idx_returns_product": ("product",),
+    "idx_returns_category": ("category",),
+    "idx_returns_reason": ("return_reason",),
+    "idx_returns_approved": ("approved_flag",),
+    "idx_returns_cost": ("cost",),
+}
+# replaced by the date_day indexes, dropped when a table gets date_day
+SUPERSEDED_INDEXES = ("idx_returns_store_date", "idx_returns_date")
+
+# columns counted per value in the returns_rollup summary table
+ROLLUP_COLUMNS = ("product", "category", "store_name", "return_reason")
+# columns counted per value and day (count, cost) in the returns_daily summary table,
+# dimension '*' (value '') holds the totals of each day
+DAILY_ROLLUP_COLUMNS = ("store_name", "product", "return_reason")
+ROLLUP_TRIGGERS = ("returns_rollup_insert", "returns_rollup_delete", "returns_rollup_update")
+# rows per transaction when date_day is added to an older table
+DATE_DAY_BATCH = 10000
+# date text -> day number in SQL, for the strict YYYY-MM-DD prefix (time of day ignored)
+ISO_DAY_SQL = "CAST(julianday(substr(trim(date), 1, 10)) - 2440587.5 AS INTEGER)"
+ISO_DATE_SQL = (
+    "substr(trim(date), 1, 10) GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' "
+    "AND date(julianday(substr(trim(date), 1, 10))) = substr(trim(date), 1, 10)"
+)
 
 class LoadDB:
-    def __init__(self):
-        self.db_path = "ReturnsData.db"
-        self.conn = None
+    def __init__(self, db_path="ReturnsData.db", pool_size=READ_POOL_SIZE, busy_timeout=BUSY_TIMEOUT_MS, pragmas=None):
+        """
+        pool_size: read-only connections shared by all threads
+        busy_timeout: ms to wait for a lock (or a free read connection)
+        pragmas: per-connection settings on top of CONNECTION_PRAGMAS, e.g. {"cache_size": -65536}
+        """
+        self.db_path = db_path
         self.table_created = False
-        self._local = threading.local()
+        self._schema_cache = None
+        # WAL database: reads go to a pool of read-only connections, writes to one writer
+        self.db = ConnectionManager(db_path, pool_size, busy_timeout, pragmas)
+
+    def _schema(self, conn=None):
+        """
+        (version, columns of returns, table names), cached until the schema changes
+        """
+        if conn is None:
+            with self.db.reader() as conn:
+                return self._schema(conn)
+        
+        # schema_version is bumped by every schema change, including those of other processes
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        cache = self._schema_cache
+        if cache is None or cache[0] != version:
+            columns = [col[1] for col in conn.execute("PRAGMA table_info(returns)").fetchall()]
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            cache = (version, columns, tables)
+            self._schema_cache = cache
+        return cache
+    
+    def get_columns(self, conn=None):
+        """
+        Column names of the returns table, cached until the schema changes
+        """
+        return self._schema(conn)[1]
     
-    def _get_connection(self):
-        """Get a thread-safe database connection"""
-        if not hasattr(self._local, 'conn') or self._local.conn is None:
-            self._local.conn = sqlite3.connect(self.db_path)
-        return self._local.conn
+    def has_table(self, name, conn=None):
+        """Whether a table exists (same cache as get_columns)"""
+        return name in self._schema(conn)[2]
     
-    def _refresh_connection(self):
-        """Refresh the thread-local connection to see latest data"""
-        if hasattr(self._local, 'conn') and self._local.conn is not None:
-            self._local.conn.close()
-            self._local.conn = None
+    def data_version(self, conn=None):
+        """
+        Cheap fingerprint of the returns data, changes whenever rows or the schema change
+        
+        (schema_version, max id, row count, returns_totals.data_version); unlike
+        PRAGMA data_version it means the same thing on every connection and process.
+        """
+        if conn is None:
+            with self.db.reader() as conn:
+                return self.data_version(conn)
+        
+        version, columns, tables = self._schema(conn)
+        if not columns:
+            return (version, 0, 0, 0)
+        
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM returns").fetchone()[0]
+        row = None
+        if 'returns_totals' in tables:
+            row = conn.execute("SELECT row_count, data_version FROM returns_totals WHERE id = 1").fetchone()
+        if row is None:
+            # no summary tables: updates in place are not seen
+            row = (conn.execute("SELECT COUNT(*) FROM returns").fetchone()[0], 0)
+        return (version, max_id, row[0], row[1])
+    
+    def _invalidate_schema(self):
+        """Drop the cached column list"""
+        self._schema_cache = None
 
-    def create_table(self, df):
+    def create_indexes(self, conn=None):
+        """
+        Create the secondary indexes used by filtered queries
+        """
+        if conn is None:
+            with self.db.writer() as conn:
+                return self.create_indexes(conn)
+        
+        columns = self.get_columns(conn)
+        for name, index_columns in INDEXES.items():
+            if all(col in columns for col in index_columns):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON returns ({', '.join(index_columns)})")
+        conn.commit()
+
+    def create_table(self, df, indexes=True):
         """
         Create a table in the database based on the DataFrame columns
+        
+        indexes: also create the secondary indexes and the summary tables
+                 (bulk loads create them after the data)
         """
-        # Use thread-safe connection
-        conn = self._get_connection()
-            
         if self.table_created:
             return
         
@@ -40,7 +147,7 @@ class LoadDB:
         for col in df.columns:
             if df[col].dtype == 'object': 
                 col_type = 'TEXT'
-            elif df[col].dtype in ['int64', 'int32']:  
+            elif str(df[col].dtype).lower() in ['int64', 'int32']:  # Int64: nullable (date_day)
                 col_type = 'INTEGER'
             elif df[col].dtype in ['float64', 'float32']:  
                 col_type = 'REAL'
@@ -53,66 +160,403 @@ class LoadDB:
         create_table_sql = f"CREATE TABLE IF NOT EXISTS returns ({', '.join(columns)})"
 
         # execute create table sql
-        conn.execute(create_table_sql)
-        conn.commit()
+        with self.db.writer() as conn:
+            conn.execute(create_table_sql)
+            conn.commit()
+            self._invalidate_schema()
+            
+            if indexes:
+                self.create_indexes(conn)
+                self.rebuild_rollups(conn)
         
         self.table_created = True
         print("Database table created")
     
-    def load_csv(self, csv_path):
+    def _rollup_triggers(self, columns):
+        """
+        CREATE TRIGGER statements that keep returns_rollup / returns_totals current
+        """
+        dimensions = [col for col in ROLLUP_COLUMNS if col in columns]
+        has_cost = 'cost' in columns
+        
+        add = [
+            f"INSERT INTO returns_rollup (dimension, value, count) SELECT '{col}', NEW.{col}, 1 "
+            f"WHERE NEW.{col} IS NOT NULL ON CONFLICT (dimension, value) DO UPDATE SET count = count + 1;"
+            for col in dimensions
+        ]
+        remove = []
+        for col in dimensions:
+            remove.append(f"UPDATE returns_rollup SET count = count - 1 WHERE dimension = '{col}' AND value = OLD.{col};")
+            remove.append(f"DELETE FROM returns_rollup WHERE dimension = '{col}' AND value = OLD.{col} AND count <= 0;")
+        
+        if 'date_day' in columns:
+            # per day: '*' totals, then one row per store / product / reason value
+            cost = "COALESCE({}.cost, 0)" if has_cost else "0"
+            for col in [None] + [col for col in DAILY_ROLLUP_COLUMNS if col in columns]:
+                name, new_value, old_value = (col, f"NEW.{col}", f"OLD.{col}") if col else ('*', "''", "''")
+                add.append(
+                    f"INSERT INTO returns_daily (dimension, value, date_day, count, cost_sum) "
+                    f"SELECT '{name}', {new_value}, NEW.date_day, 1, {cost.format('NEW')} "
+                    f"WHERE NEW.date_day IS NOT NULL AND {new_value} IS NOT NULL "
+                    f"ON CONFLICT (dimension, date_day, value) DO UPDATE SET "
+                    f"count = count + 1, cost_sum = cost_sum + excluded.cost_sum;"
+                )
+                match = f"dimension = '{name}' AND date_day = OLD.date_day AND value = {old_value}"
+                remove.append(f"UPDATE returns_daily SET count = count - 1, cost_sum = cost_sum - {cost.format('OLD')} WHERE {match};")
+                remove.append(f"DELETE FROM returns_daily WHERE {match} AND count <= 0;")
+        
+        if has_cost:
+            add.append(
+                "UPDATE returns_totals SET row_count = row_count + 1, data_version = data_version + 1, "
+                "cost_count = cost_count + (NEW.cost IS NOT NULL), "
+                "cost_sum = cost_sum + COALESCE(NEW.cost, 0), "
+                "cost_min = CASE WHEN NEW.cost IS NOT NULL AND (cost_min IS NULL OR NEW.cost < cost_min) THEN NEW.cost ELSE cost_min END, "
+                "cost_max = CASE WHEN NEW.cost IS NOT NULL AND (cost_max IS NULL OR NEW.cost > cost_max) THEN NEW.cost ELSE cost_max END "
+                "WHERE id = 1;"
+            )
+            # min/max cannot be undone incrementally, the cost index makes them O(log n)
+            remove.append(
+                "UPDATE returns_totals SET row_count = row_count - 1, data_version = data_version + 1, "
+                "cost_count = cost_count - (OLD.cost IS NOT NULL), "
+                "cost_sum = cost_sum - COALESCE(OLD.cost, 0), "
+                "cost_min = (SELECT MIN(cost) FROM returns), "
+                "cost_max = (SELECT MAX(cost) FROM returns) "
+                "WHERE id = 1;"
+            )
+        else:
+            add.append("UPDATE returns_totals SET row_count = row_count + 1, data_version = data_version + 1 WHERE id = 1;")
+            remove.append("UPDATE returns_totals SET row_count = row_count - 1, data_version = data_version + 1 WHERE id = 1;")
+        
+        return [
+            f"CREATE TRIGGER IF NOT EXISTS returns_rollup_insert AFTER INSERT ON returns BEGIN {' '.join(add)} END",
+            f"CREATE TRIGGER IF NOT EXISTS returns_rollup_delete AFTER DELETE ON returns BEGIN {' '.join(remove)} END",
+            f"CREATE TRIGGER IF NOT EXISTS returns_rollup_update AFTER UPDATE ON returns BEGIN {' '.join(remove + add)} END",
+        ]
+    
+    def rebuild_rollups(self, conn=None):
+        """
+        Recompute the summary tables from the returns table and (re)create their triggers
+        
+        returns_rollup: (dimension, value) -> count for product, category, store_name, return_reason
+        returns_totals: one row with row_count, the running cost count/sum/min/max
+                        and data_version, bumped by every row change
+        returns_daily: (dimension, date_day, value) -> count, cost_sum for store_name, product,
+                       return_reason and '*' (all returns of the day)
+        Tables from before date_day get the column (filled from date) and its indexes first.
+        """
+        if conn is None:
+            with self.db.writer() as conn:
+                return self.rebuild_rollups(conn)
+        
+        for trigger in ROLLUP_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        migrated = self._add_date_day(conn)
+        columns = self.get_columns(conn)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS returns_rollup ("
+            "dimension TEXT NOT NULL, value, count INTEGER NOT NULL, "
+            "PRIMARY KEY (dimension, value)) WITHOUT ROWID"
+        )
+        conn.execute("DROP TABLE IF EXISTS returns_totals")
+        conn.execute(
+            "CREATE TABLE returns_totals ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), row_count INTEGER NOT NULL, "
+            "cost_count INTEGER NOT NULL, cost_sum REAL NOT NULL, cost_min REAL, cost_max REAL, "
+            "data_version INTEGER NOT NULL DEFAULT 0)"
+        )
+        
+        conn.execute("DELETE FROM returns_rollup")
+        for col in ROLLUP_COLUMNS:
+            if col in columns:
+                conn.execute(
+                    f"INSERT INTO returns_rollup (dimension, value, count) "
+                    f"SELECT '{col}', {col}, COUNT(*) FROM returns WHERE {col} IS NOT NULL GROUP BY {col}"
+                )
+        
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS returns_daily ("
+            "dimension TEXT NOT NULL, date_day INTEGER NOT NULL, value NOT NULL, "
+            "count INTEGER NOT NULL, cost_sum REAL NOT NULL, "
+            "PRIMARY KEY (dimension, date_day, value)) WITHOUT ROWID"
+        )
+        conn.execute("DELETE FROM returns_daily")
+        if 'date_day' in columns:
+            cost_sum = "COALESCE(SUM(cost), 0)" if 'cost' in columns else "0"
+            conn.execute(
+                "INSERT INTO returns_daily (dimension, date_day, value, count, cost_sum) "
+                f"SELECT '*', date_day, '', COUNT(*), {cost_sum} FROM returns WHERE date_day IS NOT NULL GROUP BY date_day"
+            )
+            for col in DAILY_ROLLUP_COLUMNS:
+                if col in columns:
+                    conn.execute(
+                        "INSERT INTO returns_daily (dimension, date_day, value, count, cost_sum) "
+                        f"SELECT '{col}', date_day, {col}, COUNT(*), {cost_sum} FROM returns "
+                        f"WHERE date_day IS NOT NULL AND {col} IS NOT NULL GROUP BY date_day, {col}"
+                    )
+        
+        cost_sql = "COUNT(cost), COALESCE(SUM(cost), 0), MIN(cost), MAX(cost)" if 'cost' in columns else "0, 0, NULL, NULL"
+        conn.execute(
+            "INSERT INTO returns_totals (id, row_count, cost_count, cost_sum, cost_min, cost_max) "
+            f"SELECT 1, COUNT(*), {cost_sql} FROM returns"
+        )
+        
+        # created in the same transaction, so no insert is missed or counted twice
+        for sql in self._rollup_triggers(columns):
+            conn.execute(sql)
+        if migrated:
+            # commits as well
+            self.create_indexes(conn)
+        else:
+            conn.commit()
+    
+    def _add_date_day(self, conn):
+        """
+        Add date_day to a returns table from before it, filled from the date column (date itself is not changed)
+        
+        YYYY-MM-DD dates are filled by one UPDATE, the other formats (MM/DD/YYYY) in
+        DATE_DAY_BATCH rows at a time by id. Run with the rollup triggers dropped.
+        Returns whether the column was added (its indexes are still to be created).
+        """
+        columns = self.get_columns(conn)
+        if 'date' not in columns or 'date_day' in columns:
+            return False
+        conn.execute("ALTER TABLE returns ADD COLUMN date_day INTEGER")
+        for index in SUPERSEDED_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        self._invalidate_schema()
+        filled = conn.execute(f"UPDATE returns SET date_day = {ISO_DAY_SQL} WHERE {ISO_DATE_SQL}").rowcount
+        conn.commit()
+        
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, date FROM returns WHERE id > ? AND date_day IS NULL AND date IS NOT NULL ORDER BY id LIMIT ?",
+                (last_id, DATE_DAY_BATCH)
+            ).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            updates = []
+            for row_id, value in rows:
+                day = date_day(value)
+                if day is not None:
+                    updates.append((day, row_id))
+            conn.executemany("UPDATE returns SET date_day = ? WHERE id = ?", updates)
+            conn.commit()
+            filled += len(updates)
+        print(f"Added date_day to {filled} records")
+        return True
+    
+    def _clean_columns(self, columns):
+        """Normalize CSV column names"""
+        return [col.lower().replace(' ', '_').replace('-', '_') for col in columns]
+    
+    def _recreate_table(self, conn, df):
+        """Drop the returns table and create it again (without indexes) for the DataFrame columns"""
+        # First, drop the table if it exists (its rollup triggers go with it)
+        conn.execute("DROP TABLE IF EXISTS returns")
+        conn.execute("DROP TABLE IF EXISTS returns_rollup")
+        conn.execute("DROP TABLE IF EXISTS returns_totals")
+        conn.execute("DROP TABLE IF EXISTS returns_daily")
+        conn.commit()
+        self._invalidate_schema()
+        
+        # Reset table_created flag
+        self.table_created = False
+        
+        # Create table with id column, indexes are built once the data is in
+        self.create_table(df, indexes=False)
+    
+    def _apply_load_pragmas(self, conn):
+        """
+        Switch the connection to fast-load settings, return the previous values
+        """
+        saved = {}
+        for pragma, value in LOAD_PRAGMAS.items():
+            saved[pragma] = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return saved
+    
+    def _restore_pragmas(self, conn, saved):
+        """Put back the settings returned by _apply_load_pragmas"""
+        for pragma, value in saved.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+
+    def _prepare_merge(self, conn, df, mode):
+        """
+        Build the INSERT ... ON CONFLICT(order_id) statement of an append/upsert load
+        """
+        table_columns = self.get_columns(conn)
+        if not table_columns:
+            # nothing to merge into yet: create the table from this file
+            self.table_created = False
+            self.create_table(df)
+            table_columns = self.get_columns(conn)
+        
+        if 'date_day' in df.columns and 'date_day' not in table_columns:
+            # table from before date_day: add the column and its rollup first
+            self.rebuild_rollups(conn)
+            table_columns = self.get_columns(conn)
+        
+        if 'order_id' not in df.columns or 'order_id' not in table_columns:
+            raise ValueError(f"{mode} mode needs an order_id column")
+        
+        # the conflict target needs a unique index on order_id
+        try:
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_returns_order_id ON returns(order_id)")
+            conn.commit()
+        except sqlite3.IntegrityError:
+            raise ValueError("order_id is not unique in the returns table, reload it in replace mode first")
+        
+        columns = [col for col in df.columns if col in table_columns and col != 'id']
+        updates = [col for col in columns if col != 'order_id']
+        
+        if mode == "upsert" and updates:
+            # only rewrite rows whose values actually changed
+            conflict = (
+                "DO UPDATE SET " + ", ".join(f"{col} = excluded.{col}" for col in updates) +
+                " WHERE " + " OR ".join(f"returns.{col} IS NOT excluded.{col}" for col in updates)
+            )
+        else:
+            conflict = "DO NOTHING"
+        
+        placeholders = ['?' for _ in columns]
+        sql = (
+            f"INSERT INTO returns ({', '.join(columns)}) VALUES ({', '.join(placeholders)}) "
+            f"ON CONFLICT(order_id) {conflict}"
+        )
+        return sql, columns
+    
+    def _merge_rows(self, conn, sql, columns, df):
+        """Write one DataFrame with the statement from _prepare_merge"""
+        df = df[columns]
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        cursor = conn.executemany(sql, rows)
+        conn.commit()
+        # rows inserted or updated, not counting the rollup triggers
+        return cursor.rowcount
+    
+    def _write_frames(self, conn, frames, mode, progress=None, fraction=None):
+        """
+        Write the CSV (one DataFrame, or its chunks) to the returns table
+        
+        Returns None when frames is empty.
+        """
+        columns = None
+        records = 0
+        start = time.perf_counter()
+        
+        saved = self._apply_load_pragmas(conn)
+        try:
+            for df in frames:
+                df.columns = self._clean_columns(df.columns)
+                if 'date' in df.columns:
+                    # sortable day number next to the date text (NULL when it is not a date), the text is kept as loaded
+                    df['date_day'] = date_days(df['date'])
+                
+                if columns is None:
+                    # infer the schema from the first chunk
+                    if mode == "replace":
+                        self._recreate_table(conn, df)
+                        columns = list(df.columns)
+                    else:
+                        merge_sql, columns = self._prepare_merge(conn, df, mode)
+                        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM returns").fetchone()[0]
+                        changes = 0
+                
+                # every chunk is its own transaction
+                with METRICS.span("sql"):
+                    if mode == "replace":
+                        df.to_sql('returns', conn, if_exists='append', index=False)
+                    else:
+                        changes += self._merge_rows(conn, merge_sql, columns, df)
+                records += len(df)
+                
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    progress({
+                        "records": records,
+                        "rows_per_sec": records / elapsed if elapsed > 0 else 0.0,
+                        "elapsed": elapsed,
+                        "fraction": fraction() if fraction else 1.0
+                    })
+        finally:
+            self._restore_pragmas(conn, saved)
+        
+        if columns is None:
+            return None
+        
+        elapsed = time.perf_counter() - start
+        rows_per_sec = records / elapsed if elapsed > 0 else 0.0
+        result = {"success": True, "mode": mode, "records": records, "columns": columns, "rows_per_sec": rows_per_sec}
+        
+        if mode == "replace":
+            # building the indexes and summary tables once is cheaper than updating them per row
+            with METRICS.span("index"):
+                self.create_indexes(conn)
+                self.rebuild_rollups(conn)
+            print(f"Successfully wrote {records} records to the database ({rows_per_sec:.0f} rows/s)")
+        else:
+            # new rows are the ones past the previous max id
+            inserted = conn.execute("SELECT COUNT(*) FROM returns WHERE id > ?", (last_id,)).fetchone()[0]
+            updated = changes - inserted
+            result.update({"inserted": inserted, "updated": updated, "unchanged": records - inserted - updated})
+            print(f"Successfully merged {records} records ({inserted} new, {updated} updated)")
+        
+        return result
+
+    def load_csv(self, csv_path, chunk_size=None, progress=None, mode="replace"):
         """
         Load CSV and create a database table
+        
+        chunk_size: stream the file in chunks of this many rows (bounded memory)
+        progress: optional callback, called after every chunk with a dict of
+                  records, rows_per_sec, elapsed and fraction (of the file read)
+        mode: "replace" rebuilds the table from the file,
+              "append" adds rows whose order_id is not in the table yet,
+              "upsert" also updates the rows whose order_id already exists
         """
         if not csv_path or not csv_path.strip():
             return {"Invalid file path"}
+        # pandas is only loaded by the processes that read CSV files
+        import pandas as pd
+        if mode not in LOAD_MODES:
+            return {"success": False, "error": f"Unknown load mode: {mode}"}
         try:
-            # step 1: read the csv file
-            df = pd.read_csv(csv_path)
-            
-            # step 2: clean the column name first
-            df.columns = [col.lower().replace(' ', '_').replace('-', '_') for col in df.columns]
-            
-            # step 3: write - replace existing data but preserve id column
-            # Use thread-safe connection
-            conn = self._get_connection()
-            
-            # First, drop the table if it exists
-            conn.execute("DROP TABLE IF EXISTS returns")
-            conn.commit()
-            
-            # Reset table_created flag
-            self.table_created = False
-            
-            # Create table with id column
-            self.create_table(df)
-            
-            # Insert data
-            df.to_sql('returns', conn, if_exists='append', index=False)
-            
-            # Refresh thread-local connections to see new data
-            self._refresh_connection()
-            
-            print(f"Successfully wrote {len(df)} records to the database")
+            # all writes go through the single writer, readers keep working meanwhile (WAL)
+            with self.db.writer() as conn:
+                if chunk_size:
+                    # stream the file, the schema comes from the first chunk
+                    total_bytes = os.path.getsize(csv_path) or 1
+                    with open(csv_path, 'rb') as f:
+                        chunks = pd.read_csv(f, chunksize=int(chunk_size))
+                        result = self._write_frames(conn, chunks, mode, progress, lambda: min(f.tell() / total_bytes, 1.0))
+                    
+                    if result is None:
+                        # header only: still create the (empty) table
+                        result = self._write_frames(conn, [pd.read_csv(csv_path, nrows=0)], mode)
+                else:
+                    # step 1: read the csv file
+                    with METRICS.span("csv"):
+                        df = pd.read_csv(csv_path)
+                    
+                    # step 2: clean the column name and write - replace or merge existing data
+                    result = self._write_frames(conn, [df], mode, progress)
             
-            return {"success": True, "records": len(df), "columns": list(df.columns)}
+            return result
             
         except FileNotFoundError:
             print(f"CSV file not found: {csv_path}")
             return {"success": False, "error": "File not found"}
         except Exception as e:
             print(f"Error loading CSV: {e}")
+            # the writer rolled back, columns it cached inside the transaction may be gone
+            self._invalidate_schema()
             return {"success": False, "error": str(e)}
             
     def close(self):
-        # Close legacy connection if exists
-        if self.conn:
-            self.conn.close()
-            self.conn = None
-        
-        # Close thread-local connection if exists
-        if hasattr(self._local, 'conn') and self._local.conn is not None:
-            self._local.conn.close()
-            self._local.conn = None
+        # Close the writer and the pooled read connections
+        self.db.close()
 
 if __name__ == "__main__":
     loader = LoadDB()
@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# histogram upper bounds in seconds (+Inf is implicit)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# RETURNS_METRICS=0 turns the registry off at start-up
+METRICS_ENV = "RETURNS_METRICS"
+
+
+def _label(value):
+    """Prometheus label value escaping: backslash, double quote and newline"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram (Prometheus style), percentiles are bucket estimates
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """upper bound of the bucket holding the q-th observation, capped at the max seen"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.50) * 1000, 3),
+            "p90_ms": round(self.quantile(0.90) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "total_sec": round(self.sum, 6),
+        }
+
+
+class _NoSpan:
+    """shared do-nothing context manager used while metrics are disabled"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class MetricsRegistry:
+    """
+    Per-action request counts, errors and latency histograms, plus nested spans
+
+    with METRICS.action("insert"):       # one handled request
+        with METRICS.span("parse"):      # recorded as "insert/parse"
+            ...
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.requests = {}
+            self.errors = {}
+            self.actions = {}
+            self.spans = {}
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def _timed(self, name, table):
+        stack = self._stack()
+        stack.append(name)
+        path = "/".join(stack)
+        start = time.perf_counter()
+        try:
+            yield path
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            with self._lock:
+                histogram = table.get(path)
+                if histogram is None:
+                    histogram = table[path] = Histogram()
+                histogram.observe(elapsed)
+
+    def action(self, name):
+        """
+        time one request; exceptions raised inside are counted as errors
+        """
+        if not self.enabled:
+            return NO_SPAN
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+        return self._action(name)
+
+    @contextmanager
+    def _action(self, name):
+        try:
+            with self._timed(name, self.actions):
+                yield
+        except Exception as e:
+            self.error(name, type(e).__name__)
+            raise
+
+    def span(self, name):
+        """
+        time one step (parse, sql, dataframe, aggregate, excel) inside the current action
+        """
+        if not self.enabled:
+            return NO_SPAN
+        return self._timed(name, self.spans)
+
+    def error(self, action, kind):
+        if not self.enabled:
+            return
+        key = (action, kind)
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def to_dict(self):
+        with self._lock:
+            uptime = max(time.time() - self.started_at, 1e-9)
+            errors_by_action = {}
+            for (action, _), count in self.errors.items():
+                errors_by_action[action] = errors_by_action.get(action, 0) + count
+            return {
+                "enabled": self.enabled,
+                "uptime_sec": round(uptime, 3),
+                "actions": {
+                    name: dict(
+                        histogram.summary(),
+                        requests=self.requests.get(name, 0),
+                        errors=errors_by_action.get(name, 0),
+                        rate_per_sec=round(self.requests.get(name, 0) / uptime, 4),
+                    )
+                    for name, histogram in sorted(self.actions.items())
+                },
+                "spans": {path: histogram.summary() for path, histogram in sorted(self.spans.items())},
+                "errors": {f"{action}:{kind}": count for (action, kind), count in sorted(self.errors.items())},
+            }
+
+    def to_prometheus(self, prefix="returns"):
+        """
+        Prometheus text exposition format
+        """
+        lines = []
+
+        def histogram_lines(metric, label, table):
+            lines.append(f"# TYPE {metric} histogram")
+            for key, histogram in sorted(table.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label}="{_label(key)}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label}="{_label(key)}"}} {histogram.sum}')
+                lines.append(f'{metric}_count{{{label}="{_label(key)}"}} {histogram.count}')
+
+        with self._lock:
+            lines.append(f"# HELP {prefix}_requests_total Requests handled per action")
+            lines.append(f"# TYPE {prefix}_requests_total counter")
+            for action, count in sorted(self.requests.items()):
+                lines.append(f'{prefix}_requests_total{{action="{_label(action)}"}} {count}')
+            lines.append(f"# HELP {prefix}_errors_total Failed requests per action and error type")
+            lines.append(f"# TYPE {prefix}_errors_total counter")
+            for (action, kind), count in sorted(self.errors.items()):
+                lines.append(f'{prefix}_errors_total{{action="{_label(action)}",type="{_label(kind)}"}} {count}')
+            lines.append(f"# HELP {prefix}_action_seconds Request latency per action")
+            histogram_lines(f"{prefix}_action_seconds", "action", self.actions)
+            lines.append(f"# HELP {prefix}_span_seconds Latency of the steps inside an action")
+            histogram_lines(f"{prefix}_span_seconds", "span", self.spans)
+        return "\n".join(lines) + "\n"
+
+
+# process-wide registry shared by every module
+METRICS = MetricsRegistry(enabled=os.environ.get(METRICS_ENV, "1") != "0")
@@ -0,0 +1,346 @@
+import re
+from datetime import date, datetime
+
+# keys recognised in "key: value" input; a key ends right before optional spaces and a colon
+# "order_id" is not listed, it is found from the "id" key (order[_\s]*id)
+KEY_NAMES = [
+    'order', 'id', 'product', 'return_reason', 'reason', 'because', 'date', 'cost',
+    'price', 'store_name', 'store', 'category', 'approved_flag', 'approved', 'status',
+]
+KEY_TAIL = max(len(key) for key in KEY_NAMES)
+# non-ASCII letters that re.IGNORECASE treats as a letter of some key
+KEY_FOLD = str.maketrans({'İ': 'i', 'ı': 'i', 'ſ': 's'})
+
+# per field, patterns in priority order: (key, pattern)
+# key is None for the heuristic fallbacks that are only tried when no keyed pattern matched
+FIELD_PATTERNS = {
+    'order_id': [
+        ('order_id', r'order[_\s]*id\s*:\s*(\d+)'),   # order_id: 123, order_id:123
+        ('order', r'order\s*:\s*(\d+)'),              # order: 123, order:123, order :123, order : 123
+        ('id', r'id\s*:\s*(\d+)'),                    # id: 123, id:123, id :123, id : 123
+        (None, r'(\d{4,})'),                          # 數字
+    ],
+    'product': [
+        ('product', r'product\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)'),             # product: Laptop
+    ],
+    'return_reason': [
+        ('reason', r'reason\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)'),               # reason: Defective
+        ('because', r'because\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)'),             # because: defective
+        ('return_reason', r'return_reason\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)'), # return_reason: Missing Accessories
+    ],
+    'date': [
+        ('date', r'date\s*:\s*(\d{4}-\d{2}-\d{2})'),  # date: 2025-01-03
+        ('date', r'date\s*:\s*(\d{2}/\d{2}/\d{4})'),  # date: 01/03/2025
+        (None, r'(\d{4}-\d{2}-\d{2})'),               # 2025-01-03
+        (None, r'(\d{2}/\d{2}/\d{4})'),               # 01/03/2025
+        (None, r'(\d{1,2}/\d{1,2}/\d{4})'),           # 1/3/2025
+    ],
+    'cost': [
+        ('cost', r'cost\s*:\s*\$?(\d+\.?\d*)'),       # cost: $128
+        ('price', r'price\s*:\s*\$?(\d+\.?\d*)'),     # price: $128
+        (None, r'\$(\d+\.?\d*)'),                     # $128
+        (None, r'(\d+\.?\d*)\s*dollars?'),            # 128 dollars
+    ],
+    'store_name': [
+        ('store', r'store\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)'),                 # store: Brooklyn Center
+        ('store_name', r'store_name\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)'),       # store_name: Sunnyvale Town
+        (None, r'at\s+([A-Za-z\s]+?)(?:\s+\w+\s*:|$)'),                           # at Brooklyn Center
+        (None, r'from\s+([A-Za-z\s]+?)(?:\s+\w+\s*:|$)'),                         # from Riverdale Outlet
+    ],
+    'category': [
+        ('category', r'category\s*:\s*([A-Za-z]+)(?:\s+\w+\s*:|$)'),             # category: Electronics
+    ],
+    'approved_flag': [
+        ('approved', r'approved\s*:\s*(yes|no|true|false)'),                      # approved: yes
+        ('status', r'status\s*:\s*(approved|rejected|pending)'),                  # status: approved
+        ('approved_flag', r'approved_flag\s*:\s*(yes|no)'),                       # approved_flag: yes
+    ],
+}
+
+APPROVAL_VALUES = {
+    'yes': "Yes", 'true': "Yes", 'approved': "Yes",
+    'no': "No", 'false': "No", 'rejected': "No",
+    'pending': "Pending",
+}
+
+
+def _title(value):
+    return value.strip().title() if value is not None else None
+
+
+def _date(value):
+    return ReturnParser.normalize_date(value) or datetime.now().strftime("%Y-%m-%d")
+
+
+def _cost(value):
+    return float(value) if value is not None else None
+
+
+def _approval(value):
+    return APPROVAL_VALUES[value.lower()] if value is not None else "No"  # 預設值
+
+
+# value clean-up per field, applied to the captured text (None when nothing matched)
+FIELD_CONVERTERS = {
+    'order_id': lambda value: value if value else None,
+    'product': _title,
+    'return_reason': _title,
+    'date': _date,
+    'cost': _cost,
+    'store_name': _title,
+    'category': _title,
+    'approved_flag': _approval,
+}
+
+
+def _titles(values):
+    return values.str.strip().str.title()
+
+
+def _dates(values):
+    # MM/DD/YYYY -> YYYY-MM-DD, as normalize_date
+    us = values.str.extract(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+    found = us[2].notna()
+    values = values.mask(found, us[2] + '-' + us[0].str.zfill(2) + '-' + us[1].str.zfill(2))
+    return values.fillna(datetime.now().strftime("%Y-%m-%d"))
+
+
+def _costs(values):
+    import pandas as pd
+    return pd.to_numeric(values, errors='coerce').astype('float64')
+
+
+def _approvals(values):
+    return values.str.lower().map(APPROVAL_VALUES).fillna("No")
+
+
+# date_day column: days since 1970-01-01, a sortable integer for range filters and daily rollups
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+US_DATE = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+# Weekly Trend sheet and RetrievalAgent.aggregate_returns weekly_trend: the last 52 weeks of data
+WEEKLY_TREND_DAYS = 364
+
+
+def date_day(value):
+    """
+    YYYY-MM-DD (time of day ignored) or MM/DD/YYYY -> day number, None when it is not a date
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    us = US_DATE.match(text)
+    if us:
+        text = f"{us[3]}-{us[1]}-{us[2]}"
+    try:
+        return datetime.strptime(text[:10], "%Y-%m-%d").toordinal() - EPOCH_ORDINAL
+    except ValueError:
+        return None
+
+
+def date_days(values):
+    """
+    date_day for a pandas Series -> nullable Int64 Series
+    """
+    import pandas as pd
+    values = pd.Series(values, dtype='object').astype('str').str.strip()
+    us = values.str.extract(US_DATE)
+    values = values.str.slice(0, 10).mask(us[2].notna(), us[2] + '-' + us[0] + '-' + us[1])
+    dates = pd.to_datetime(values, format="%Y-%m-%d", errors='coerce')
+    return (dates - pd.Timestamp('1970-01-01')).dt.days.astype('Int64')
+
+
+def day_to_date(day):
+    """day number -> YYYY-MM-DD"""
+    return date.fromordinal(day + EPOCH_ORDINAL).isoformat()
+
+
+# FIELD_CONVERTERS for a whole column (pandas Series, NaN when nothing matched)
+SERIES_CONVERTERS = {
+    'order_id': lambda values: values,
+    'product': _titles,
+    'return_reason': _titles,
+    'date': _dates,
+    'cost': _costs,
+    'store_name': _titles,
+    'category': _titles,
+    'approved_flag': _approvals,
+}
+
+
+def to_record(parsed, available_columns):
+    """
+    parse() result -> column values for the returns table (product goes to product_name on older tables)
+    """
+    record = {}
+    for field, value in parsed.items():
+        if field == 'product':
+            if value:
+                if 'product_name' in available_columns:
+                    record['product_name'] = value
+                elif 'product' in available_columns:
+                    record['product'] = value
+        else:
+            record[field] = value
+    if 'date_day' in available_columns and 'date' in parsed:
+        record['date_day'] = date_day(parsed['date'])
+    return record
+
+
+def to_frame(parsed, available_columns):
+    """
+    parse_series() result -> column values for the returns table, to_record for a whole DataFrame
+    """
+    frame = parsed.copy()
+    if 'product' in frame.columns:
+        # an empty product (only spaces after the key) is left out, as in to_record
+        frame['product'] = frame['product'].mask(frame['product'] == '')
+        if 'product_name' in available_columns:
+            frame = frame.rename(columns={'product': 'product_name'})
+        elif 'product' not in available_columns:
+            frame = frame.drop(columns='product')
+    if 'date_day' in available_columns and 'date' in frame.columns:
+        frame['date_day'] = date_days(frame['date'])
+    return frame
+
+
+class ReturnParser:
+    """
+    Parser engine for natural language return records
+    """
+    # everything is compiled once, when the class is defined
+    field_patterns = {
+        field: [(key, re.compile(pattern, re.IGNORECASE)) for key, pattern in patterns]
+        for field, patterns in FIELD_PATTERNS.items()
+    }
+    # the same patterns without IGNORECASE, for lower-cased ASCII text (literal prefixes are searched much faster)
+    series_patterns = {
+        field: [re.compile(pattern) for _, pattern in patterns]
+        for field, patterns in FIELD_PATTERNS.items()
+    }
+
+    def __init__(self):
+        # dispatch table: last characters before a colon -> keys ending there
+        self._key_cache = {}
+
+    def _keys_ending(self, tail):
+        """
+        keys that end at the end of tail, as (key, length)
+        """
+        lowered = tail.translate(KEY_FOLD).lower()
+        keys = tuple((key, len(key)) for key in KEY_NAMES if lowered.endswith(key))
+        if len(self._key_cache) > 4096:
+            self._key_cache.clear()
+        self._key_cache[tail] = keys
+        return keys
+
+    def scan_keys(self, text):
+        """
+        find every "key:" position in one pass over the text
+        """
+        positions = {}
+        key_cache = self._key_cache
+        offset = 0
+        for segment in text.split(':')[:-1]:
+            head = segment.rstrip()
+            key_end = offset + len(head)
+            offset += len(segment) + 1
+
+            tail = head[-KEY_TAIL:]
+            keys = key_cache.get(tail)
+            if keys is None:
+                keys = self._keys_ending(tail)
+
+            for key, length in keys:
+                start = key_end - length
+                if key in positions:
+                    positions[key].append(start)
+                else:
+                    positions[key] = [start]
+
+                if key == 'id':
+                    # order_id / order id / orderid: "order" right before the [_\s]* gap
+                    i = start
+                    while i > 0 and (text[i - 1] == '_' or text[i - 1].isspace()):
+                        i -= 1
+                    if i >= 5 and text[i - 5:i].translate(KEY_FOLD).lower() == 'order':
+                        positions.setdefault('order_id', []).append(i - 5)
+        return positions
+
+    def match_field(self, text, field, positions):
+        """
+        return the first captured value of a field, in pattern priority order
+        """
+        for key, pattern in self.field_patterns[field]:
+            if key is None:
+                # heuristic fallback, only reached when no keyed pattern matched
+                match = pattern.search(text)
+                if match:
+                    return match.group(1)
+            elif key in positions:
+                for pos in positions[key]:
+                    match = pattern.match(text, pos)
+                    if match:
+                        return match.group(1)
+        return None
+
+    def parse(self, text, fields=None):
+        """
+        parse one input into {field: value}, only for the requested fields
+        """
+        positions = self.scan_keys(text)
+        return {
+            field: FIELD_CONVERTERS[field](self.match_field(text, field, positions))
+            for field in (fields if fields is not None else FIELD_PATTERNS)
+        }
+
+    def parse_series(self, texts, fields=None):
+        """
+        vectorized parse() of a pandas Series of texts -> DataFrame (same index), one column per field
+
+        Every pattern runs once per column with Series.str.extract, in the same priority
+        order as parse(), and only on the rows no earlier pattern matched. ASCII texts are
+        lower-cased once and searched case-sensitively: the captured words are title-cased
+        afterwards, so the result is the same. Other texts go through parse() one by one.
+        """
+        import pandas as pd
+
+        fields = list(fields if fields is not None else FIELD_PATTERNS)
+        texts = pd.Series(texts, dtype='object').fillna('').astype('str')
+        # Series.str.isascii only exists from pandas 3
+        ascii_rows = texts.map(str.isascii).astype('bool')
+        lowered = texts[ascii_rows].str.lower()
+
+        columns = {}
+        for field in fields:
+            values = pd.Series(None, index=lowered.index, dtype='object')
+            remaining = lowered
+            for pattern in self.series_patterns[field]:
+                if remaining.empty:
+                    break
+                found = remaining.str.extract(pattern, expand=False)
+                matched = found.notna()
+                values.loc[found.index[matched]] = found[matched]
+                remaining = remaining[~matched]
+            columns[field] = SERIES_CONVERTERS[field](values)
+        parsed = pd.DataFrame(columns, index=lowered.index, columns=fields)
+
+        if not ascii_rows.all():
+            others = texts[~ascii_rows]
+            dtypes = parsed.dtypes.to_dict()
+            others = pd.DataFrame([self.parse(text, fields) for text in others],
+                                  index=others.index, columns=fields).astype(dtypes)
+            parsed = parsed.reindex(texts.index)
+            parsed.loc[others.index] = others
+        return parsed
+
+    @staticmethod
+    def normalize_date(date_str):
+        """
+        標準化日期格式為 YYYY-MM-DD
+        """
+        if not date_str:
+            return None
+        if '/' in date_str:
+            month, day, year = date_str.split('/')
+            return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+        return date_str  # 已經是 YYYY-MM-DD 格式
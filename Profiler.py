@@ -0,0 +1,210 @@
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from Metrics import NO_SPAN
+
+# RETURNS_PROFILE=1 turns profiling on at start-up, RETURNS_PROFILE_THRESHOLD_MS sets the threshold
+PROFILE_ENV = "RETURNS_PROFILE"
+THRESHOLD_ENV = "RETURNS_PROFILE_THRESHOLD_MS"
+
+PROFILE_DIR = ".profiles"
+MAX_ARTIFACTS = 50
+# statements whose plan is worth showing
+EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+MAX_EXPLAINS = 20
+
+
+class RequestProfiler:
+    """
+    Profiles requests while enabled and keeps the artifacts of the slow ones
+
+    For every request slower than threshold_ms a directory is written with
+    the cProfile stats (profile.pstats / profile.txt), the tracemalloc top
+    allocations (memory.txt) and the SQL issued with its EXPLAIN QUERY PLAN
+    (sql.json). Only the newest max_artifacts directories are kept.
+    """
+    def __init__(self, db, directory=PROFILE_DIR, threshold_ms=500, max_artifacts=MAX_ARTIFACTS, enabled=False):
+        self.db = db
+        self.directory = directory
+        self.threshold_ms = threshold_ms
+        self.max_artifacts = max_artifacts
+        self.enabled = False
+        self.captured = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+        if enabled:
+            self.enable()
+
+    @classmethod
+    def from_env(cls, db, **options):
+        options.setdefault("enabled", os.environ.get(PROFILE_ENV, "0") == "1")
+        if os.environ.get(THRESHOLD_ENV):
+            options.setdefault("threshold_ms", float(os.environ[THRESHOLD_ENV]))
+        return cls(db, **options)
+
+    def enable(self, threshold_ms=None):
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._started_tracemalloc = True
+        # SQL of every connection borrowed from now on goes to _record_sql
+        self.db.trace_callback = self._record_sql
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.db.trace_callback = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _record_sql(self, statement):
+        statements = getattr(self._local, "statements", None)
+        if statements is not None:
+            statements.append(statement)
+        for shared in getattr(self._local, "shared", ()):
+            shared.append(statement)
+
+    def statements(self):
+        """
+        SQL list of the request profiled on this thread (None outside one), for work handed to another thread
+        """
+        return getattr(self._local, "statements", None)
+
+    @contextmanager
+    def recording(self, targets):
+        """
+        SQL issued on this thread meanwhile also goes to targets (statements() lists of other threads)
+        """
+        self._local.shared = list(targets)
+        try:
+            yield
+        finally:
+            self._local.shared = ()
+
+    def request(self, action, data=None):
+        """
+        context manager around one request; a no-op while disabled
+        """
+        if not self.enabled or getattr(self._local, "statements", None) is not None:
+            # off, or already inside a profiled request on this thread
+            return NO_SPAN
+        return self._profile(action, data)
+
+    @contextmanager
+    def _profile(self, action, data):
+        # imported on first use, a disabled profiler costs nothing at start-up
+        import cProfile
+        self._local.statements = []
+        profile = cProfile.Profile()
+        error = None
+        start = time.perf_counter()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active on this thread
+            profile = None
+        try:
+            yield
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if profile is not None:
+                profile.disable()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            statements = self._local.statements
+            self._local.statements = None
+            if elapsed_ms >= self.threshold_ms:
+                try:
+                    self._write_artifacts(action, data, elapsed_ms, error, profile, statements)
+                except Exception as e:
+                    print(f"Profiler: could not write artifacts: {e}")
+
+    def _explain(self, statements):
+        """distinct statements with their count and query plan"""
+        counts = {}
+        for statement in statements:
+            counts[statement] = counts.get(statement, 0) + 1
+
+        explained = []
+        with self.db.reader() as conn:
+            conn.set_trace_callback(None)
+            for statement, count in counts.items():
+                entry = {"sql": statement, "count": count}
+                if EXPLAINABLE.match(statement) and len(explained) < MAX_EXPLAINS:
+                    try:
+                        entry["plan"] = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+                    except Exception as e:
+                        entry["plan_error"] = str(e)
+                explained.append(entry)
+        return explained
+
+    def _write_artifacts(self, action, data, elapsed_ms, error, profile, statements):
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(self.directory, f"{stamp}_{re.sub(r'[^A-Za-z0-9_]+', '_', str(action))}_{elapsed_ms:.0f}ms")
+        os.makedirs(path, exist_ok=True)
+
+        with open(os.path.join(path, "request.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "action": action,
+                "data": repr(data)[:2000],
+                "elapsed_ms": round(elapsed_ms, 3),
+                "threshold_ms": self.threshold_ms,
+                "thread": threading.current_thread().name,
+                "error": error,
+            }, f, indent=2, ensure_ascii=False)
+
+        if profile is not None:
+            import pstats
+            profile.dump_stats(os.path.join(path, "profile.pstats"))
+            text = io.StringIO()
+            pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(40)
+            with open(os.path.join(path, "profile.txt"), "w", encoding="utf-8") as f:
+                f.write(text.getvalue())
+
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:20]
+            with open(os.path.join(path, "memory.txt"), "w", encoding="utf-8") as f:
+                f.write(f"traced now: {current / 1024 / 1024:.1f} MB, peak: {peak / 1024 / 1024:.1f} MB\n\n")
+                for stat in top:
+                    f.write(f"{stat}\n")
+
+        with open(os.path.join(path, "sql.json"), "w", encoding="utf-8") as f:
+            json.dump(self._explain(statements), f, indent=2, ensure_ascii=False)
+
+        with self._lock:
+            self.captured += 1
+            self._rotate()
+
+    def _rotate(self):
+        artifacts = self.artifacts()
+        for name in artifacts[self.max_artifacts:]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def artifacts(self):
+        """artifact directory names, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name for name in os.listdir(self.directory)
+                       if os.path.isdir(os.path.join(self.directory, name))), reverse=True)
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "directory": os.path.abspath(self.directory),
+            "captured": self.captured,
+            "artifacts": self.artifacts()[:10],
+        }
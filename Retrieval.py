@@ -1,212 +1,140 @@
-import pandas as pd
-from datetime import datetime
-import re
-import sqlite3
+import csv
+import gzip
+import json
+import os
+import sys
 import threading
-from LoadDB import LoadDB
+from collections import OrderedDict
+from datetime import date
+from LoadDB import LoadDB, ROLLUP_COLUMNS, DAILY_ROLLUP_COLUMNS
+from Parser import ReturnParser, to_record, to_frame, date_day, day_to_date, EPOCH_ORDINAL, WEEKLY_TREND_DAYS
+from Metrics import METRICS
+
+# fields in the order analyze_input reports them
+PARSED_FIELDS = ['order_id', 'product', 'return_reason', 'date', 'cost', 'store_name', 'category', 'approved_flag']
+
+# analysis dict key -> grouped column, as in ReportAgent.analyze_data
+AGGREGATE_COLUMNS = {
+    'by_product': 'product',
+    'by_category': 'category',
+    'by_store': 'store_name',
+    'by_reason': 'return_reason',
+}
+
+# read results kept per data version, the least recently used are dropped beyond either limit;
+# a single result larger than SNAPSHOT_MAX_BYTES (a big unfiltered query) is not kept at all
+SNAPSHOT_MAX_ENTRIES = 64
+SNAPSHOT_MAX_BYTES = 256 * 1024 * 1024
+# rows measured with memory_usage(deep=True) to estimate the size of a DataFrame
+SIZE_SAMPLE_ROWS = 1000
+
+# stored but not part of the records shown, exported or reported
+HIDDEN_COLUMNS = ('id', 'created_at', 'date_day')
+
+# query filters: name -> (column, operator)
+# "=" filters also take a list of values (IN), dates are YYYY-MM-DD (or MM/DD/YYYY)
+# and compared as day numbers on date_day when the table has it
+QUERY_FILTERS = {
+    'store': ('store_name', '='),
+    'store_name': ('store_name', '='),
+    'product': ('product', '='),
+    'category': ('category', '='),
+    'reason': ('return_reason', '='),
+    'return_reason': ('return_reason', '='),
+    'approved_flag': ('approved_flag', '='),
+    'date_from': ('date', '>='),
+    'date_to': ('date', '<='),
+    'cost_min': ('cost', '>='),
+    'cost_max': ('cost', '<='),
+}
+
+# iter_returns DataFrame chunks: float32 cost, categoricals for the low-cardinality text columns
+# (date too: one value per day, and per-row date strings fragment the heap of long-lived frames)
+COMPACT_DTYPES = {'cost': 'float32'}
+CATEGORICAL_COLUMNS = ('product', 'category', 'return_reason', 'store_name', 'approved_flag', 'date')
+
+# trend buckets: period -> SQL of the first day of the bucket holding date_day
+# (weeks start on Monday, 1970-01-01 was a Thursday)
+TREND_PERIODS = {
+    'day': "date_day",
+    'week': "date_day - ((date_day + 3) % 7 + 7) % 7",
+    'month': "CAST(julianday(date_day * 86400, 'unixepoch', 'start of month') - 2440587.5 AS INTEGER)",
+}
+# trend dimension names, as the filters -> column
+TREND_DIMENSIONS = {'store': 'store_name', 'product': 'product', 'reason': 'return_reason'}
+
+def approx_bytes(value):
+    """
+    approximate memory held by a read result: DataFrames (also inside dicts, as query_page rows)
+    from memory_usage of a sample scaled to all rows, other values from sys.getsizeof
+    """
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approx_bytes(item) for item in value.values())
+    if hasattr(value, "memory_usage") and hasattr(value, "head"):
+        rows = len(value)
+        if not rows:
+            return int(value.memory_usage(deep=True).sum())
+        sample = min(rows, SIZE_SAMPLE_ROWS)
+        return int(value.head(sample).memory_usage(deep=True).sum() * rows / sample)
+    return sys.getsizeof(value)
+
 
 class RetrievalAgent(LoadDB):
     """
     RAG Agent - LoadDB and Retrieval
     """
-    def __init__(self):
-        super().__init__()
-        self.conn = None
-        self._local = threading.local()
-
-    def _get_connection(self):
-        """Get a thread-safe database connection"""
-        if not hasattr(self._local, 'conn') or self._local.conn is None:
-            self._local.conn = sqlite3.connect(self.db_path)
-        return self._local.conn
-    
-    def _refresh_connection(self):
-        """Refresh the thread-local connection to see latest data"""
-        if hasattr(self._local, 'conn') and self._local.conn is not None:
-            self._local.conn.close()
-            self._local.conn = None
+    def __init__(self, snapshot_max_entries=SNAPSHOT_MAX_ENTRIES, snapshot_max_bytes=SNAPSHOT_MAX_BYTES, **options):
+        # options: connection settings, see LoadDB (db_path, pool_size, busy_timeout, pragmas)
+        super().__init__(**options)
+        self.parser = ReturnParser()
+        # read results shared by every caller until the data version changes (LRU)
+        self.snapshot_max_entries = snapshot_max_entries
+        self.snapshot_max_bytes = snapshot_max_bytes
+        self._snapshots = OrderedDict()
+        # key -> approx_bytes of the entry, and their total
+        self._snapshot_sizes = {}
+        self._snapshot_bytes = 0
+        self._snapshot_version = None
+        self._snapshot_lock = threading.Lock()
+        self.snapshot_hits = 0
+        self.snapshot_misses = 0
+        self.snapshot_evictions = 0
 
-    def analyze_input(self, text):
+    def analyze_input(self, text, available_columns=None):
         """
         analyze natural language input
         """
-        # 使用線程安全的連接
-        conn = self._get_connection()
-            
-        # check which fields are available in the database
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA table_info(returns)")
-        columns_info = cursor.fetchall()
-        available_columns = [col[1] for col in columns_info]
-        
-        analyzed_data = {}
-        
-        # order_id
-        order_patterns = [
-            r'order[_\s]*id\s*:\s*(\d+)',  # order_id: 123, order_id:123
-            r'order\s*:\s*(\d+)',          # order: 123, order:123, order :123, order : 123
-            r'id\s*:\s*(\d+)',             # id: 123, id:123, id :123, id : 123
-            r'(\d{4,})'                    # 數字
-        ]
-        
-        order_id = None
-        for pattern in order_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                order_id = match.group(1)
-                break
-        
-        if 'order_id' in available_columns:
-            analyzed_data['order_id'] = order_id if order_id else None
+        if available_columns is None:
+            # check which fields are available in the database
+            available_columns = self.get_columns()
         
-        # product 
-        product_patterns = [
-            r'product\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',     # product: Laptop, product:Laptop, product :Laptop, product : Laptop
-        ]
-        
-        product_value = None
-        for pattern in product_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                product_value = match.group(1).strip().title()  # 大小寫
-                break
-        
-        if product_value:
-            if 'product_name' in available_columns:
-                analyzed_data['product_name'] = product_value
-            elif 'product' in available_columns:
-                analyzed_data['product'] = product_value
-        
-        # return_reason 
-        if 'return_reason' in available_columns:
-            reason = None
-            
-            # 優先使用模式匹配
-            reason_patterns = [
-                r'reason\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',      # reason: Defective, reason:Defective, reason :Defective, reason : Defective
-                r'because\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',     # because: defective, because:defective, because :defective, because : defective
-                r'return_reason\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)', # return_reason: Missing Accessories, return_reason:Missing Accessories, return_reason :Missing Accessories, return_reason : Missing Accessories
-            ]
-            
-            for pattern in reason_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    reason = match.group(1).strip().title()
-                    break
-            
-
-            
-            analyzed_data['return_reason'] = reason
-        
-        # date 
-        if 'date' in available_columns:
-            date_patterns = [
-                r'date\s*:\s*(\d{4}-\d{2}-\d{2})', # date: 2025-01-03, date:2025-01-03, date :2025-01-03, date : 2025-01-03
-                r'date\s*:\s*(\d{2}/\d{2}/\d{4})', # date: 01/03/2025, date:01/03/2025, date :01/03/2025, date : 01/03/2025
-                r'(\d{4}-\d{2}-\d{2})',           # 2025-01-03
-                r'(\d{2}/\d{2}/\d{4})',           # 01/03/2025
-                r'(\d{1,2}/\d{1,2}/\d{4})',       # 1/3/2025
-            ]
-            
-            extracted_date = None
-            for pattern in date_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    date_str = match.group(1)
-                    # 標準化日期格式為 YYYY-MM-DD
-                    if '/' in date_str:
-                        if len(date_str.split('/')[2]) == 4:  # MM/DD/YYYY
-                            month, day, year = date_str.split('/')
-                            extracted_date = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-                    else:
-                        extracted_date = date_str  # 已經是 YYYY-MM-DD 格式
-                    break
-            
-            analyzed_data['date'] = extracted_date if extracted_date else datetime.now().strftime("%Y-%m-%d")
-        
-        # cost 
-        if 'cost' in available_columns:
-            cost_patterns = [
-                r'cost\s*:\s*\$?(\d+\.?\d*)',       # cost: $128, cost:$128, cost :$128, cost : $128
-                r'price\s*:\s*\$?(\d+\.?\d*)',      # price: $128, price:$128, price :$128, price : $128
-                r'\$(\d+\.?\d*)',                   # $128
-                r'(\d+\.?\d*)\s*dollars?',          # 128 dollars
-            ]
-            
-            cost_value = None
-            for pattern in cost_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    cost_value = float(match.group(1))
-                    break
-            
-            analyzed_data['cost'] = cost_value
-        
-        # store_name 
-        if 'store_name' in available_columns:
-            store_patterns = [
-                r'store\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',       # store: Brooklyn Center, store:Brooklyn Center, store :Brooklyn Center, store : Brooklyn Center
-                r'store_name\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',  # store_name: Sunnyvale Town, store_name:Sunnyvale Town, store_name :Sunnyvale Town, store_name : Sunnyvale Town
-                r'at\s+([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',              # at Brooklyn Center
-                r'from\s+([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',            # from Riverdale Outlet
-            ]
-            
-            store_value = None
-            for pattern in store_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    store_value = match.group(1).strip().title()
-                    break
-            
-            analyzed_data['store_name'] = store_value
-        
-        # category 
-        if 'category' in available_columns:
-            category_patterns = [
-                r'category\s*:\s*([A-Za-z]+)(?:\s+\w+\s*:|$)',      # category: Electronics, category:Electronics, category :Electronics, category : Electronics
-            ]
-            
-            category_value = None
-            for pattern in category_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    category_value = match.group(1).strip().title()
-                    break
-            
-            analyzed_data['category'] = category_value
-        
-        # approved_flag 
-        if 'approved_flag' in available_columns:
-            approval_patterns = [
-                r'approved\s*:\s*(yes|no|true|false)',     # approved: yes, approved:yes, approved :yes, approved : yes
-                r'status\s*:\s*(approved|rejected|pending)', # status: approved, status:approved, status :approved, status : approved
-                r'approved_flag\s*:\s*(yes|no)',           # approved_flag: yes, approved_flag:yes, approved_flag :yes, approved_flag : yes
-            ]
-            
-            approval_value = "No"  # 預設值
-            for pattern in approval_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    status = match.group(1).lower()
-                    if status in ['yes', 'true', 'approved']:
-                        approval_value = "Yes"
-                    elif status in ['no', 'false', 'rejected']:
-                        approval_value = "No"
-                    elif status == 'pending':
-                        approval_value = "Pending"
-                    break
-            
-            analyzed_data['approved_flag'] = approval_value
+        with METRICS.span("parse"):
+            parsed = self.parser.parse(text, self.parse_fields(available_columns))
+        return to_record(parsed, available_columns)
+    
+    def analyze_series(self, texts, available_columns=None):
+        """
+        analyze_input for a pandas Series of texts (vectorized), one DataFrame row per text
         
-        return analyzed_data
+        cost is float64, the other columns strings; missing values are NaN
+        """
+        if available_columns is None:
+            available_columns = self.get_columns()
+        with METRICS.span("parse"):
+            parsed = self.parser.parse_series(texts, self.parse_fields(available_columns))
+        return to_frame(parsed, available_columns)
+    
+    @staticmethod
+    def parse_fields(available_columns):
+        """
+        only parse the fields the table can store (product is always parsed)
+        """
+        return [field for field in PARSED_FIELDS if field == 'product' or field in available_columns]
     
     def insert_return(self, text_input):
         """
         insert new return record
         """
-        # 使用線程安全的連接
-        conn = self._get_connection()
-        
         # analyze input
         data = self.analyze_input(text_input)
         print(f" 新一筆退貨記錄: {data}")
@@ -222,35 +150,684 @@ class RetrievalAgent(LoadDB):
         sql = f"INSERT INTO returns ({', '.join(columns)}) VALUES ({', '.join(placeholders)})"
         
         try:
-            cursor = conn.cursor()
-            cursor.execute(sql, values)
-            conn.commit()   
-            return self.get_all_returns()
+            # 寫入一律經由單一 writer 連線
+            with self.db.writer() as conn, METRICS.span("sql"):
+                cursor = conn.cursor()
+                cursor.execute(sql, values)
+                conn.commit()   
+                return {
+                    "success": True,
+                    "id": cursor.lastrowid,
+                    "data": data,
+                    "records": self.row_count(conn)
+                }
 
         except Exception as e:
             print(f"Error inserting data: {e}")
             return {"Error": str(e)}
     
-    def get_all_returns(self):
+    def insert_many(self, texts):
+        """
+        insert a batch of return records in one transaction
+        
+        When the batch fails (e.g. an order_id already in a UNIQUE index), the rows are
+        inserted one by one and only the failing ones are reported as errors.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts or [])
+        if not texts:
+            return {"success": True, "inserted": 0, "failed": 0, "results": []}
+
+        # check the available fields once for the whole batch
+        available_columns = self.get_columns()
+
+        # analyze all inputs first
+        results = []
+        parsed = []
+        for text in texts:
+            data = self.analyze_input(text, available_columns)
+            if not data:
+                results.append({"Error": "無法分析輸入", "input": text})
+            else:
+                results.append(None)
+                parsed.append((len(results) - 1, data))
+
+        if parsed:
+            try:
+                first_id = self.insert_records([data for _, data in parsed])
+            except Exception as e:
+                print(f"Error inserting batch: {e}, retrying row by row")
+                inserted = []
+                for index, data in parsed:
+                    try:
+                        results[index] = {"success": True, "id": self.insert_records([data]), "data": data}
+                        inserted.append((index, data))
+                    except Exception as e:
+                        results[index] = {"Error": str(e), "input": texts[index]}
+                parsed = inserted
+            else:
+                for offset, (index, data) in enumerate(parsed):
+                    results[index] = {"success": True, "id": first_id + offset, "data": data}
+
+        inserted = len(parsed)
+        print(f"Successfully inserted {inserted} of {len(texts)} records")
+        return {
+            "success": inserted > 0,
+            "inserted": inserted,
+            "failed": len(texts) - inserted,
+            "records": self.row_count(),
+            "results": results
+        }
+
+    def insert_records(self, records):
+        """
+        insert already analyzed records (analyze_input results) in one transaction
+        
+        returns the id of the first row, the others follow consecutively; raises on error
+        """
+        # one column list for the batch so a single executemany covers every row
+        columns = []
+        for data in records:
+            for col in data:
+                if col not in columns:
+                    columns.append(col)
+
+        return self._insert_rows(columns, [[data.get(col) for col in columns] for data in records])
+
+    def insert_frame(self, frame):
+        """
+        insert an analyze_series DataFrame in one transaction, NaN is stored as NULL; returns the first id
+        """
+        rows = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+        return self._insert_rows(list(frame.columns), rows)
+
+    def _insert_rows(self, columns, rows):
+        placeholders = ['?' for _ in columns]
+        sql = f"INSERT INTO returns ({', '.join(columns)}) VALUES ({', '.join(placeholders)})"
+
+        with self.db.writer() as conn, METRICS.span("sql"):
+            cursor = conn.executemany(sql, rows)
+            inserted = cursor.rowcount
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            conn.commit()
+        # rows of one executemany get consecutive ids
+        return last_id - inserted + 1
+
+    def snapshot(self, key, compute):
+        """
+        compute() once per data version, the same result is returned to every caller and thread
+        
+        key: anything json-serialisable that identifies the read (action + arguments)
+        Results are shared, treat them as read-only. At most snapshot_max_entries
+        results and snapshot_max_bytes (approx_bytes) are kept, the least recently
+        used go first; a result larger than snapshot_max_bytes is returned but not kept.
+        """
+        key = json.dumps(key, sort_keys=True, default=str)
+        version = self.data_version()
+        with self._snapshot_lock:
+            if version != self._snapshot_version:
+                self._snapshots = OrderedDict()
+                self._snapshot_sizes = {}
+                self._snapshot_bytes = 0
+                self._snapshot_version = version
+            if key in self._snapshots:
+                self.snapshot_hits += 1
+                self._snapshots.move_to_end(key)
+                return self._snapshots[key]
+            self.snapshot_misses += 1
+        
+        value = compute()
+        size = approx_bytes(value)
+        if size > self.snapshot_max_bytes:
+            return value
+        with self._snapshot_lock:
+            # a write may have landed meanwhile, only keep results of the current version
+            if version == self._snapshot_version and key not in self._snapshots:
+                self._snapshots[key] = value
+                self._snapshot_sizes[key] = size
+                self._snapshot_bytes += size
+                while (len(self._snapshots) > self.snapshot_max_entries
+                       or self._snapshot_bytes > self.snapshot_max_bytes):
+                    evicted, _ = self._snapshots.popitem(last=False)
+                    self._snapshot_bytes -= self._snapshot_sizes.pop(evicted)
+                    self.snapshot_evictions += 1
+        return value
+    
+    def snapshot_stats(self):
+        return {
+            "version": self._snapshot_version,
+            "entries": len(self._snapshots),
+            "max_entries": self.snapshot_max_entries,
+            "bytes": self._snapshot_bytes,
+            "max_bytes": self.snapshot_max_bytes,
+            "evictions": self.snapshot_evictions,
+            "hits": self.snapshot_hits,
+            "misses": self.snapshot_misses,
+        }
+    
+    def row_count(self, conn=None):
+        """
+        number of return records, O(1) from the returns_totals summary table
+        """
+        if conn is None:
+            with self.db.reader() as conn:
+                return self.row_count(conn)
+        if self.has_table('returns_totals', conn):
+            row = conn.execute("SELECT row_count FROM returns_totals WHERE id = 1").fetchone()
+            if row:
+                return row[0]
+        return conn.execute("SELECT COUNT(*) FROM returns").fetchone()[0]
+
+    def data_columns(self, conn=None):
+        """
+        columns of the return records, without HIDDEN_COLUMNS
+        """
+        return [col for col in self.get_columns(conn) if col not in HIDDEN_COLUMNS]
+
+    def iter_rows(self, chunk_size=10000):
+        """
+        (column names, generator of row chunks), newest first, read with fetchmany
+        """
+        column_names = self.data_columns()
+        return column_names, self.iter_returns(chunk_size, column_names, as_frame=False)
+
+    def iter_returns(self, chunk_size=10000, columns=None, filters=None, as_frame=True, compact=True, conn=None):
+        """
+        generator of the return records in chunks, newest first, straight from the cursor (fetchmany)
+        
+        columns: the columns to read, default data_columns()
+        filters: as query_returns
+        as_frame: DataFrame chunks, False: lists of row tuples (no pandas)
+        compact: DataFrame dtypes from COMPACT_DTYPES, CATEGORICAL_COLUMNS are categoricals with
+                 the same categories in every chunk (pd.concat keeps them categorical);
+                 date is read as the day of date_day (YYYY-MM-DD), the stored text when it is not a date
+        conn: a connection already in a read transaction (to read other things from the same snapshot)
+        The read connection (and its snapshot) is held until the generator is exhausted or closed;
+        by default it is a scan_reader, not one of the pooled readers.
+        """
+        if conn is None:
+            with self.db.scan_reader() as conn:
+                # one read transaction: the categories and the rows come from the same snapshot
+                conn.execute("BEGIN")
+                yield from self.iter_returns(chunk_size, columns, filters, as_frame, compact, conn)
+            return
+        
+        available_columns = self.data_columns(conn)
+        if columns is None:
+            columns = available_columns
+        for column in columns:
+            if column not in available_columns:
+                raise ValueError(f"Column not in table: {column}")
+        where, params = self.build_filters(filters, conn)
+        
+        selected = list(columns)
+        if as_frame:
+            import pandas as pd
+            dtypes = self.compact_dtypes(columns, conn) if compact else {}
+            if compact and 'date' in columns and 'date_day' in self.get_columns(conn):
+                # one category per day, whatever format (or time of day) the text was loaded with
+                selected[columns.index('date')] = (
+                    "CASE WHEN date_day IS NULL THEN date ELSE date(date_day * 86400, 'unixepoch') END AS date"
+                )
+        
+        cursor = conn.execute(f"SELECT {', '.join(selected)} FROM returns {where} ORDER BY id DESC", params)
+        while True:
+            with METRICS.span("sql"):
+                rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            if as_frame:
+                with METRICS.span("dataframe"):
+                    rows = pd.DataFrame.from_records(rows, columns=columns).astype(dtypes)
+            yield rows
+
+    def export_csv(self, output_file, filters=None, compress=False, chunk_size=10000):
+        """
+        write the (filtered) return records to a CSV file, newest first, streamed from the cursor
+        
+        compress: gzip the file; memory use does not grow with the table
+        data_version in the result is the version of the rows written (read in the same snapshot)
+        """
+        rows = 0
+        opener = gzip.open if compress else open
+        options = {"compresslevel": 6} if compress else {}
+        with self.db.scan_reader() as conn:
+            conn.execute("BEGIN")
+            version = self.data_version(conn)
+            column_names = self.data_columns(conn)
+            with METRICS.span("csv"), opener(output_file, "wt", newline="", encoding="utf-8", **options) as f:
+                writer = csv.writer(f)
+                writer.writerow(column_names)
+                for chunk in self.iter_returns(chunk_size, column_names, filters, as_frame=False, conn=conn):
+                    writer.writerows(chunk)
+                    rows += len(chunk)
+        return {
+            "success": True,
+            "rows": rows,
+            "bytes": os.path.getsize(output_file),
+            "compressed": bool(compress),
+            "data_version": version,
+        }
+
+    def read_frame(self, columns=None, filters=None, compact=True, chunk_size=50000):
+        """
+        one DataFrame built from iter_returns chunks (no fetchall list held next to it)
+        """
+        import pandas as pd
+        frames = list(self.iter_returns(chunk_size, columns, filters, as_frame=True, compact=compact))
+        if not frames:
+            names = columns or self.data_columns()
+            return pd.DataFrame(columns=names)
+        return pd.concat(frames, ignore_index=True)
+
+    def compact_dtypes(self, columns, conn):
+        """
+        {column: dtype} of iter_returns for the given columns
+        """
+        import pandas as pd
+        dtypes = {col: dtype for col, dtype in COMPACT_DTYPES.items() if col in columns}
+        for column in CATEGORICAL_COLUMNS:
+            if column in columns:
+                dtypes[column] = pd.CategoricalDtype(self.category_values(column, conn))
+        return dtypes
+
+    def category_values(self, column, conn):
+        """
+        distinct non-NULL values of a column, sorted: from returns_rollup when it is kept there, else the index
+        
+        date: the days of returns_daily (as iter_returns reads them) and the texts that are not dates (date_day NULL)
+        """
+        if column == 'date' and 'date_day' in self.get_columns(conn) and self.has_table('returns_daily', conn):
+            days = conn.execute("SELECT date_day FROM returns_daily WHERE dimension = '*'")
+            others = conn.execute("SELECT DISTINCT date FROM returns WHERE date_day IS NULL AND date IS NOT NULL")
+            return sorted([day_to_date(row[0]) for row in days] + [row[0] for row in others], key=str)
+        if column in ROLLUP_COLUMNS and self.has_table('returns_rollup', conn):
+            rows = conn.execute(
+                "SELECT value FROM returns_rollup WHERE dimension = ? AND count > 0 AND value IS NOT NULL",
+                (column,)
+            )
+        else:
+            rows = conn.execute(f"SELECT DISTINCT {column} FROM returns WHERE {column} IS NOT NULL")
+        return sorted((row[0] for row in rows), key=str)
+
+    def get_all_returns(self, conn=None):
         """
         get all return records
         """
-        # 使用線程安全的連接
-        conn = self._get_connection()
+        # 使用連線池中的唯讀連接
+        if conn is None:
+            with self.db.reader() as conn:
+                return self.get_all_returns(conn)
             
         cursor = conn.cursor()
-        cursor.execute("PRAGMA table_info(returns)")
-        columns_info = cursor.fetchall()
-        column_names = [col[1] for col in columns_info if col[1] not in ['id', 'created_at']]
+        column_names = self.data_columns(conn)
         
         # select all records - use id for ordering
-        cursor.execute(f"SELECT {', '.join(column_names)} FROM returns ORDER BY id DESC")
-        rows = cursor.fetchall()
+        with METRICS.span("sql"):
+            cursor.execute(f"SELECT {', '.join(column_names)} FROM returns ORDER BY id DESC")
+            rows = cursor.fetchall()
         
         # DataFrame
-        df = pd.DataFrame(rows, columns=column_names)
+        with METRICS.span("dataframe"):
+            import pandas as pd
+            df = pd.DataFrame(rows, columns=column_names)
         return df
     
+    def build_filters(self, filters, conn=None):
+        """
+        compile query filters into a parameterized WHERE clause
+        
+        returns (sql, params); sql is "" when there is nothing to filter
+        """
+        if not filters:
+            return "", []
+        
+        available_columns = self.get_columns(conn)
+        conditions = []
+        params = []
+        for name, value in filters.items():
+            if value is None or value == "" or value == []:
+                continue
+            if name not in QUERY_FILTERS:
+                raise ValueError(f"Unknown filter: {name}")
+            column, operator = QUERY_FILTERS[name]
+            if column == 'date' and 'date_day' in available_columns:
+                # day numbers: indexed, and right for any stored date format
+                day = date_day(value)
+                if day is None:
+                    raise ValueError(f"Invalid date for {name}: {value}")
+                column, value = 'date_day', day
+            if column not in available_columns:
+                raise ValueError(f"Column not in table: {column}")
+            
+            if operator == '=' and isinstance(value, (list, tuple, set)):
+                values = list(value)
+                conditions.append(f"{column} IN ({', '.join('?' for _ in values)})")
+                params.extend(values)
+            else:
+                if column == 'date':
+                    value = str(value)  # date objects -> YYYY-MM-DD
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        
+        if not conditions:
+            return "", []
+        return "WHERE " + " AND ".join(conditions), params
+
+    def query_returns(self, filters=None, limit=None, conn=None):
+        """
+        get the return records matching the filters (SQL-side, uses the indexes)
+        """
+        if conn is None:
+            with self.db.reader() as conn:
+                return self.query_returns(filters, limit, conn)
+        
+        column_names = self.data_columns(conn)
+        where, params = self.build_filters(filters, conn)
+        
+        sql = f"SELECT {', '.join(column_names)} FROM returns {where} ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        
+        with METRICS.span("sql"):
+            rows = conn.execute(sql, params).fetchall()
+        with METRICS.span("dataframe"):
+            import pandas as pd
+            return pd.DataFrame(rows, columns=column_names)
+    
+    def query_page(self, filters=None, cursor=None, page_size=50, conn=None, as_frame=True):
+        """
+        one page of return records, newest first (keyset pagination on id)
+        
+        cursor: the next_cursor of the previous page, None for the first page
+        returns {"rows": DataFrame, "next_cursor": id or None}
+        as_frame: False returns the rows as a list of {column: value} dicts (no pandas)
+        """
+        if conn is None:
+            with self.db.reader() as conn:
+                return self.query_page(filters, cursor, page_size, conn, as_frame)
+        
+        column_names = self.data_columns(conn)
+        where, params = self.build_filters(filters, conn)
+        
+        if cursor is not None:
+            where = (where + " AND " if where else "WHERE ") + "id < ?"
+            params.append(int(cursor))
+        
+        # one extra row tells whether there is a next page
+        page_size = int(page_size)
+        sql = f"SELECT id, {', '.join(column_names)} FROM returns {where} ORDER BY id DESC LIMIT ?"
+        with METRICS.span("sql"):
+            rows = conn.execute(sql, params + [page_size + 1]).fetchall()
+        
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        if as_frame:
+            import pandas as pd
+            page = pd.DataFrame([row[1:] for row in rows], columns=column_names)
+        else:
+            page = [dict(zip(column_names, row[1:])) for row in rows]
+        return {
+            "rows": page,
+            "next_cursor": rows[-1][0] if has_next else None
+        }
+
+    def count_returns(self, filters=None, conn=None):
+        """
+        number of return records matching the filters
+        """
+        if conn is None:
+            with self.db.reader() as conn:
+                return self.count_returns(filters, conn)
+        where, params = self.build_filters(filters, conn)
+        if not where:
+            return self.row_count(conn)
+        return conn.execute(f"SELECT COUNT(*) FROM returns {where}", params).fetchone()[0]
+
+    def value_counts(self, column, filters=None, conn=None):
+        """
+        {value: count} of one column, most common first (GROUP BY in SQLite, NULLs skipped)
+        """
+        if conn is None:
+            with self.db.reader() as conn:
+                return self.value_counts(column, filters, conn)
+        if column not in self.get_columns(conn):
+            return {}
+        
+        where, params = self.build_filters(filters, conn)
+        if not where and column in ROLLUP_COLUMNS and self.has_table('returns_rollup', conn):
+            # unfiltered: read the maintained counts, O(distinct values)
+            rows = conn.execute(
+                "SELECT value, count FROM returns_rollup WHERE dimension = ? ORDER BY count DESC, value",
+                (column,)
+            ).fetchall()
+            return dict(rows)
+        
+        where = (where + " AND " if where else "WHERE ") + f"{column} IS NOT NULL"
+        rows = conn.execute(
+            f"SELECT {column}, COUNT(*) AS n FROM returns {where} GROUP BY {column} ORDER BY n DESC, {column}",
+            params
+        ).fetchall()
+        return dict(rows)
+
+    def aggregate_returns(self, filters=None, conn=None):
+        """
+        the ReportAgent.analyze_data statistics, computed with GROUP BY / aggregate queries in SQLite
+        
+        plain sqlite3 rows only: recent_returns is a list of {column: value} dicts
+        """
+        if conn is None:
+            with self.db.reader() as conn, METRICS.span("aggregate"):
+                return self.aggregate_returns(filters, conn)
+        available_columns = self.get_columns(conn)
+        where, params = self.build_filters(filters, conn)
+        
+        total_returns = self.count_returns(filters, conn)
+        if total_returns == 0:
+            return {}
+        
+        analysis = {"total_returns": total_returns}
+        for key, column in AGGREGATE_COLUMNS.items():
+            analysis[key] = self.value_counts(column, filters, conn)
+        
+        # cost analysis
+        cost_analysis = {}
+        if 'cost' in available_columns:
+            if not where and self.has_table('returns_totals', conn):
+                count, total, maximum, minimum = conn.execute(
+                    "SELECT cost_count, cost_sum, cost_max, cost_min FROM returns_totals WHERE id = 1"
+                ).fetchone()
+                average = total / count if count else None
+            else:
+                count, total, average, maximum, minimum = conn.execute(
+                    f"SELECT COUNT(cost), SUM(cost), AVG(cost), MAX(cost), MIN(cost) FROM returns {where}",
+                    params
+                ).fetchone()
+            if count:
+                cost_analysis = {'total': total, 'average': average, 'max': maximum, 'min': minimum}
+        analysis["cost_analysis"] = cost_analysis
+        
+        if 'date_day' in available_columns:
+            analysis["weekly_trend"] = self.trend("week", last_days=WEEKLY_TREND_DAYS, filters=filters, conn=conn)["rows"]
+        
+        analysis["recent_returns"] = self.query_page(filters, page_size=10, conn=conn, as_frame=False)["rows"]
+        return analysis
+    
+    def trend(self, period="week", dimension=None, last_days=None, date_from=None, date_to=None, filters=None, conn=None):
+        """
+        returns and cost per day / week / month, oldest first, read from the returns_daily rollup
+        
+        dimension: None for all returns, or store / product / reason (one series per value)
+        last_days: the last N days up to date_to (default date_to: the latest date in the data),
+                   the first bucket is widened back to its start
+        filters: as query_returns, grouped on the returns table (date_day index) instead of the rollup
+        returns {"period", "dimension", "date_from", "date_to",
+                 "rows": [{"period": first day YYYY-MM-DD, ("value",) "returns", "cost"}]}
+        """
+        if conn is None:
+            with self.db.reader() as conn, METRICS.span("trend"):
+                return self.trend(period, dimension, last_days, date_from, date_to, filters, conn)
+        if period not in TREND_PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+        column = TREND_DIMENSIONS.get(dimension, dimension) if dimension else None
+        if column is not None and column not in DAILY_ROLLUP_COLUMNS:
+            raise ValueError(f"Unknown trend dimension: {dimension}")
+        available_columns = self.get_columns(conn)
+        if 'date_day' not in available_columns or (column and column not in available_columns):
+            raise ValueError("No date_day column, run rebuild_rollups")
+        
+        where, params = self.build_filters(filters, conn)
+        use_rollup = not where and self.has_table('returns_daily', conn)
+        
+        day_from = self._day(date_from, 'date_from')
+        day_to = self._day(date_to, 'date_to')
+        if day_to is None:
+            if use_rollup:
+                day_to = conn.execute("SELECT MAX(date_day) FROM returns_daily WHERE dimension = '*'").fetchone()[0]
+            else:
+                day_to = conn.execute("SELECT MAX(date_day) FROM returns").fetchone()[0]
+        result = {"period": period, "dimension": column, "date_from": None, "date_to": None, "rows": []}
+        if day_to is None:
+            # no dated returns
+            return result
+        if last_days:
+            start = day_to - int(last_days) + 1
+            day_from = start if day_from is None else max(day_from, start)
+        if day_from is not None:
+            day_from = self._bucket_start(period, day_from)
+        
+        bucket = TREND_PERIODS[period]
+        conditions = ["date_day <= ?"]
+        range_params = [day_to]
+        if day_from is not None:
+            conditions.append("date_day >= ?")
+            range_params.append(day_from)
+        
+        if use_rollup:
+            sql = (
+                f"SELECT {bucket} AS bucket, value, SUM(count), SUM(cost_sum) FROM returns_daily "
+                f"WHERE dimension = ? AND {' AND '.join(conditions)} GROUP BY bucket, value ORDER BY bucket, value"
+            )
+            params = [column or '*'] + range_params
+        else:
+            conditions.append("date_day IS NOT NULL")
+            if column:
+                conditions.append(f"{column} IS NOT NULL")
+            where = (where + " AND " if where else "WHERE ") + " AND ".join(conditions)
+            cost_sum = "COALESCE(SUM(cost), 0)" if 'cost' in available_columns else "0"
+            value_sql = column or "''"
+            sql = (
+                f"SELECT {bucket} AS bucket, {value_sql} AS value, COUNT(*), {cost_sum} FROM returns "
+                f"{where} GROUP BY bucket, value ORDER BY bucket, value"
+            )
+            params = params + range_params
+        
+        with METRICS.span("sql"):
+            rows = conn.execute(sql, params).fetchall()
+        for start, value, count, cost in rows:
+            row = {"period": day_to_date(start)}
+            if column:
+                row["value"] = value
+            row.update({"returns": count, "cost": round(float(cost), 2)})
+            result["rows"].append(row)
+        if day_from is None and rows:
+            day_from = rows[0][0]
+        result["date_from"] = day_to_date(day_from) if day_from is not None else None
+        result["date_to"] = day_to_date(day_to)
+        return result
+    
+    @staticmethod
+    def _day(value, name):
+        """date filter value -> day number (None stays None)"""
+        if value is None or value == "":
+            return None
+        day = date_day(value)
+        if day is None:
+            raise ValueError(f"Invalid date for {name}: {value}")
+        return day
+    
+    @staticmethod
+    def _bucket_start(period, day):
+        """first day of the TREND_PERIODS bucket holding day"""
+        if period == 'week':
+            return day - (day + 3) % 7
+        if period == 'month':
+            return date.fromordinal(day + EPOCH_ORDINAL).replace(day=1).toordinal() - EPOCH_ORDINAL
+        return day
+    
+    def check_rollups(self, conn=None):
+        """
+        verify the summary tables against the returns table
+        
+        returns {"consistent": bool, "mismatches": [...]}
+        """
+        if conn is None:
+            with self.db.reader() as conn:
+                return self.check_rollups(conn)
+        if not self.has_table('returns_totals', conn):
+            return {"consistent": False, "mismatches": ["summary tables missing, run rebuild_rollups"]}
+        
+        available_columns = self.get_columns(conn)
+        mismatches = []
+        for column in ROLLUP_COLUMNS:
+            if column not in available_columns:
+                continue
+            rollup = dict(conn.execute(
+                "SELECT value, count FROM returns_rollup WHERE dimension = ?", (column,)
+            ).fetchall())
+            actual = dict(conn.execute(
+                f"SELECT {column}, COUNT(*) FROM returns WHERE {column} IS NOT NULL GROUP BY {column}"
+            ).fetchall())
+            for value in set(rollup) | set(actual):
+                if rollup.get(value, 0) != actual.get(value, 0):
+                    mismatches.append(f"{column}={value!r}: rollup {rollup.get(value, 0)}, table {actual.get(value, 0)}")
+        
+        totals = conn.execute(
+            "SELECT row_count, cost_count, cost_sum, cost_min, cost_max FROM returns_totals WHERE id = 1"
+        ).fetchone()
+        cost_sql = "COUNT(cost), COALESCE(SUM(cost), 0), MIN(cost), MAX(cost)" if 'cost' in available_columns else "0, 0, NULL, NULL"
+        actual = conn.execute(f"SELECT COUNT(*), {cost_sql} FROM returns").fetchone()
+        if totals is None:
+            mismatches.append("returns_totals row missing")
+        else:
+            for name, expected, found in zip(("row_count", "cost_count", "cost_sum", "cost_min", "cost_max"), actual, totals):
+                if expected is None or found is None:
+                    same = expected is found
+                else:
+                    same = abs(expected - found) <= 1e-6 * max(1.0, abs(expected))
+                if not same:
+                    mismatches.append(f"{name}: rollup {found}, table {expected}")
+        
+        if 'date_day' in available_columns:
+            if not self.has_table('returns_daily', conn):
+                mismatches.append("returns_daily missing, run rebuild_rollups")
+            else:
+                mismatches.extend(self._check_daily(available_columns, conn))
+        
+        return {"consistent": not mismatches, "mismatches": mismatches}
+    
+    def _check_daily(self, available_columns, conn):
+        """returns_daily counts and cost sums against GROUP BY date_day on the returns table"""
+        mismatches = []
+        cost_sum = "COALESCE(SUM(cost), 0)" if 'cost' in available_columns else "0"
+        for column in [None] + [col for col in DAILY_ROLLUP_COLUMNS if col in available_columns]:
+            dimension = column or '*'
+            value_sql = column or "''"
+            rollup = {(day, value): (count, cost) for day, value, count, cost in conn.execute(
+                "SELECT date_day, value, count, cost_sum FROM returns_daily WHERE dimension = ?", (dimension,)
+            )}
+            actual = {(day, value): (count, cost) for day, value, count, cost in conn.execute(
+                f"SELECT date_day, {value_sql}, COUNT(*), {cost_sum} FROM returns "
+                f"WHERE date_day IS NOT NULL AND {value_sql} IS NOT NULL GROUP BY date_day, {value_sql}"
+            )}
+            for key in set(rollup) | set(actual):
+                found, expected = rollup.get(key, (0, 0.0)), actual.get(key, (0, 0.0))
+                if found[0] != expected[0] or abs(found[1] - expected[1]) > 1e-6 * max(1.0, abs(expected[1])):
+                    mismatches.append(f"daily {dimension}={key[1]!r} on {day_to_date(key[0])}: rollup {found}, table {expected}")
+        return mismatches
+    
     def close(self):
         super().close()
 
@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from Metrics import METRICS, NO_SPAN
+
+DURABILITY_MODES = ("wait", "enqueue")
+
+
+class GroupCommitQueue:
+    """
+    Write-behind queue for natural language inserts, committed in groups
+
+    Inserts queued while the previous commit ran, plus those arriving within
+    `window` seconds (up to `batch_size`), share one transaction through
+    RetrievalAgent.insert_many; every caller gets its own result through a Future.
+    window=0 never delays a lone insert, batches form from concurrent callers.
+    profiler: RequestProfiler, the SQL of a commit is added to the profiled requests in its batch
+    """
+    def __init__(self, agent, batch_size=256, window=0.0, profiler=None):
+        self.agent = agent
+        self.profiler = profiler
+        self.batch_size = batch_size
+        self.window = window
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.inserted = 0
+        self.failed = 0
+
+    def submit(self, text):
+        """
+        queue one insert, the Future resolves to the insert_return style result once committed
+        """
+        future = Future()
+        # the commit runs on the group-commit thread, the caller's profile gets its SQL from there
+        statements = self.profiler.statements() if self.profiler else None
+        self._start()
+        self._queue.put((text, future, statements))
+        return future
+
+    def insert(self, text, durability="wait", timeout=None):
+        """
+        durability: "wait" returns after the commit,
+                    "enqueue" returns at once (the row is lost if the process dies before the commit)
+        """
+        if durability not in DURABILITY_MODES:
+            return {"Error": f"Unknown durability: {durability}"}
+        future = self.submit(text)
+        if durability == "enqueue":
+            return {"success": True, "queued": True, "pending": self._queue.qsize()}
+        return future.result(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+
+            # collect what arrives during the window, a commit in progress also gathers the next batch
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                self._commit(batch)
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _commit(self, batch):
+        texts = [text for text, _, _ in batch]
+        profiled = [statements for _, _, statements in batch if statements is not None]
+        recording = self.profiler.recording(profiled) if profiled else NO_SPAN
+        try:
+            with METRICS.action("group_commit"), recording:
+                # a row that fails to insert only fails its own caller (insert_many retries row by row)
+                result = self.agent.insert_many(texts)
+            rows = [(row, result["records"]) for row in result["results"]]
+        except Exception as e:
+            rows = [({"Error": str(e)}, None) for _ in batch]
+
+        self.batches += 1
+        for (_, future, _), (row, records) in zip(batch, rows):
+            if row.get("success"):
+                self.inserted += 1
+                future.set_result({"success": True, "id": row["id"], "data": row["data"], "records": records})
+            else:
+                self.failed += 1
+                future.set_result({"Error": row["Error"]})
+
+    def flush(self):
+        """
+        block until every queued insert is committed
+        """
+        self._queue.join()
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "batches": self.batches,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "avg_batch": (self.inserted + self.failed) / self.batches if self.batches else 0.0,
+        }
+
+    def close(self):
+        """
+        commit what is queued and stop the writer thread
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
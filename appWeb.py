@@ -9,20 +9,30 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def get_controller():
+    """One Controller for the whole process, shared by every session and rerun"""
+    from Controller import Controller
+    return Controller()
+
 # session state
-if 'controller' not in st.session_state:
+try:
+    controller = get_controller()
+except Exception as e:
+    st.error(f"Failed to initialize system: {str(e)}")
+    st.stop()
+
+if 'data_loaded' not in st.session_state:
+    # data loaded by another session (or an earlier run) is already there
     try:
-        from Controller import Controller
-        st.session_state.controller = Controller()
+        st.session_state.data_loaded = controller.handle_request("count") > 0
+    except Exception:
         st.session_state.data_loaded = False
-    except Exception as e:
-        st.error(f"Failed to initialize system: {str(e)}")
-        st.stop()
 
 def safe_handle_request(action, data=None):
     """Safely handle controller requests with error handling"""
     try:
-        return st.session_state.controller.handle_request(action, data)
+        return controller.handle_request(action, data)
     except Exception as e:
         st.error(f"System error: {str(e)}")
         return None
@@ -50,10 +60,35 @@ def main():
                 with open(temp_file_path, "wb") as f:
                     f.write(uploaded_file.getbuffer())
                 
+                chunk_size = st.number_input(
+                    "Rows per chunk",
+                    min_value=1000,
+                    value=50000,
+                    step=1000,
+                    help="Large files are streamed in chunks of this many rows"
+                )
+                load_mode = st.selectbox(
+                    "Load mode",
+                    ["replace", "append", "upsert"],
+                    help="replace: rebuild the table / append: add new order_ids / upsert: add and update by order_id"
+                )
+
                 if st.button("Load Data", type="primary"):
+                    progress_bar = st.progress(0.0)
+                    progress_text = st.empty()
+
+                    def show_progress(info):
+                        progress_bar.progress(info['fraction'])
+                        progress_text.caption(f"{info['records']:,} rows ({info['rows_per_sec']:,.0f} rows/s)")
+
                     with st.spinner("Loading data..."):
-                        result = safe_handle_request("load_csv", temp_file_path)
-                        
+                        result = safe_handle_request("load_csv", {
+                            "csv_path": temp_file_path,
+                            "chunk_size": chunk_size,
+                            "progress": show_progress,
+                            "mode": load_mode
+                        })
+
                         if result and result.get('success'):
                             st.success(f"Loaded {result['records']} records")
                             st.session_state.data_loaded = True
@@ -93,6 +128,38 @@ def main():
             except Exception as e:
                 st.error(f"Error loading sample data: {str(e)}")
     
+        # metrics panel (optional)
+        st.divider()
+        if st.checkbox("Show metrics", help="Per-action latency, spans and errors since start-up"):
+            metrics = safe_handle_request("metrics")
+            if isinstance(metrics, dict) and metrics.get('actions'):
+                st.caption(f"Uptime {metrics['uptime_sec']:.0f}s")
+                st.dataframe(
+                    pd.DataFrame.from_dict(metrics['actions'], orient='index')[
+                        ['requests', 'errors', 'p50_ms', 'p99_ms', 'max_ms', 'rate_per_sec']
+                    ],
+                    use_container_width=True
+                )
+                with st.expander("Spans"):
+                    if metrics.get('spans'):
+                        st.dataframe(
+                            pd.DataFrame.from_dict(metrics['spans'], orient='index')[['count', 'mean_ms', 'p99_ms', 'total_sec']],
+                            use_container_width=True
+                        )
+                    else:
+                        st.caption("No spans recorded yet")
+                st.download_button(
+                    label="Download Prometheus metrics",
+                    data=safe_handle_request("metrics", {"format": "prometheus"}),
+                    file_name="metrics.prom",
+                    mime="text/plain"
+                )
+                if st.button("Reset metrics"):
+                    safe_handle_request("metrics", {"reset": True})
+                    st.rerun()
+            else:
+                st.info("No requests recorded yet")
+    
     # 主要內容 - 分頁
     tab1, tab2, tab3, tab4 = st.tabs([
         "➕ Insert Return", 
@@ -148,9 +215,9 @@ def main():
                     with st.spinner("Processing..."):
                         result = safe_handle_request("insert", user_input)
                         
-                        if isinstance(result, pd.DataFrame):
+                        if isinstance(result, dict) and result.get('success'):
                             st.success("Record inserted successfully!")
-                            st.write(f"Total records: {len(result)}")
+                            st.write(f"Total records: {result['records']}")
                         else:
                             if result is None:
                                 st.error("Insert failed: System error - no response")
@@ -165,10 +232,10 @@ def main():
         if st.session_state.data_loaded:
             st.subheader("Recent Returns")
             try:
-                all_returns = safe_handle_request("query")
-                if isinstance(all_returns, pd.DataFrame) and not all_returns.empty:
+                recent = safe_handle_request("query_page", {"page_size": 5})
+                if isinstance(recent, dict) and not recent['rows'].empty:
                     # show recent 5 records
-                    st.dataframe(all_returns.head(), use_container_width=True)
+                    st.dataframe(recent['rows'], use_container_width=True)
                 else:
                     st.info("No records found")
             except Exception as e:
@@ -180,42 +247,113 @@ def main():
         
         if st.session_state.data_loaded:
             if st.button("Refresh Data"):
+                st.session_state.page_cursors = [None]
+                st.session_state.export = None
                 st.rerun()
                 
             try:
-                all_returns = safe_handle_request("query")
+                # query filters, shared by the page view and the CSV export
+                reset_pages = lambda: st.session_state.update(page_cursors=[None], export=None)
+                with st.expander("Filters"):
+                    col1, col2, col3 = st.columns(3)
+                    filter_columns = [(col1, "store", "store_name", "Store"),
+                                      (col2, "product", "product", "Product"),
+                                      (col3, "reason", "return_reason", "Return reason")]
+                    filters = {}
+                    for col, name, column, label in filter_columns:
+                        with col:
+                            options = safe_handle_request("value_counts", {"column": column}) or {}
+                            selected = st.multiselect(label, sorted(options), key=f"filter_{name}", on_change=reset_pages)
+                            if selected:
+                                filters[name] = selected
                 
-                if isinstance(all_returns, pd.DataFrame) and not all_returns.empty:
+                total = safe_handle_request("count", filters or None)
+                
+                if isinstance(total, int) and total > 0:
                     # 顯示統計
                     col1, col2, col3 = st.columns(3)
                     with col1:
-                        st.metric("Total Returns", len(all_returns))
+                        st.metric("Total Returns", total)
+                    # same filters as the count, the page and the export
                     with col2:
-                        if 'product' in all_returns.columns:
-                            st.metric("Unique Products", all_returns['product'].nunique())
+                        product_counts = safe_handle_request("value_counts", {"column": "product", "filters": filters or None})
+                        if product_counts:
+                            st.metric("Unique Products", len(product_counts))
                     with col3:
-                        if 'return_reason' in all_returns.columns:
-                            top_reason = all_returns['return_reason'].value_counts().iloc[0] if 'return_reason' in all_returns.columns else 'N/A'
-                            st.metric("Top Reason", top_reason)
+                        reason_counts = safe_handle_request("value_counts", {"column": "return_reason", "filters": filters or None})
+                        if reason_counts:
+                            st.metric("Top Reason", next(iter(reason_counts)))
+                    
+                    # show one page of records (keyset pagination, newest first)
+                    if 'page_cursors' not in st.session_state:
+                        st.session_state.page_cursors = [None]
                     
-                    # show all records
-                    st.dataframe(all_returns, use_container_width=True)
+                    page_size = st.selectbox(
+                        "Rows per page",
+                        [25, 50, 100, 500],
+                        index=1,
+                        on_change=lambda: st.session_state.update(page_cursors=[None])
+                    )
+                    page = safe_handle_request("query_page", {
+                        "filters": filters or None,
+                        "cursor": st.session_state.page_cursors[-1],
+                        "page_size": page_size
+                    })
                     
-                    # download options
+                    if isinstance(page, dict) and 'rows' in page:
+                        st.dataframe(page['rows'], use_container_width=True)
+                        
+                        col1, col2, col3 = st.columns([1, 1, 4])
+                        with col1:
+                            if st.button("◀ Newer", disabled=len(st.session_state.page_cursors) == 1):
+                                st.session_state.page_cursors.pop()
+                                st.rerun()
+                        with col2:
+                            if st.button("Older ▶", disabled=page['next_cursor'] is None):
+                                st.session_state.page_cursors.append(page['next_cursor'])
+                                st.rerun()
+                        with col3:
+                            st.caption(f"Page {len(st.session_state.page_cursors)}")
+                    
+                    # download: the CSV is written only when asked for, streamed from SQLite
+                    # (same filters, optionally gzip) and reused until the data changes
                     try:
-                        csv = all_returns.to_csv(index=False)
-                        st.download_button(
-                            label="Download as CSV",
-                            data=csv,
-                            file_name=f"return_records_{datetime.now().strftime('%Y%m%d')}.csv",
-                            mime="text/csv"
-                        )
+                        col1, col2 = st.columns([1, 4])
+                        with col1:
+                            compress = st.checkbox("gzip", key="export_gzip", on_change=lambda: st.session_state.update(export=None))
+                        with col2:
+                            if st.button("Prepare CSV download"):
+                                st.session_state.export = safe_handle_request("export_csv", {
+                                    "filters": filters or None,
+                                    "gzip": compress
+                                })
+                        
+                        export = st.session_state.get("export")
+                        if isinstance(export, dict) and export.get("success"):
+                            extension = "csv.gz" if export["compressed"] else "csv"
+                            try:
+                                with open(export["file"], "rb") as f:
+                                    st.download_button(
+                                        label=f"Download {export['rows']:,} records ({export['bytes'] / 1024 / 1024:.1f} MB)",
+                                        data=f,
+                                        file_name=f"return_records_{datetime.now().strftime('%Y%m%d')}.{extension}",
+                                        mime="application/gzip" if export["compressed"] else "text/csv"
+                                    )
+                                if export.get("cached"):
+                                    st.caption("Unchanged data: reused the previous export")
+                            except FileNotFoundError:
+                                # evicted from the export cache meanwhile, prepare it again
+                                st.session_state.export = None
+                                st.info("The export expired, please prepare it again")
+                        elif isinstance(export, dict) and "Error" in export:
+                            st.error(f"Error creating download: {export['Error']}")
                     except Exception as e:
                         st.error(f"Error creating download: {str(e)}")
                 else:
                     st.info("No records found")
             except Exception as e:
                 st.error(f"Error loading records: {str(e)}")
+    
         else:
             st.warning("Please load data first")
     
@@ -225,32 +363,62 @@ def main():
         
         if st.session_state.data_loaded:
             try:
-                all_returns = safe_handle_request("query")
+                analysis = safe_handle_request("aggregate")
                 
-                if isinstance(all_returns, pd.DataFrame) and not all_returns.empty:
+                if isinstance(analysis, dict) and analysis.get('total_returns'):
                     # basic statistics
                     col1, col2 = st.columns(2)
                     
                     with col1:
                         st.subheader("Product Category")
-                        if 'product' in all_returns.columns:
-                            product_counts = all_returns['product'].value_counts()
+                        if analysis['by_product']:
+                            product_counts = pd.Series(analysis['by_product'])
                             st.bar_chart(product_counts)
                     
                     with col2:
                         st.subheader("Return Reasons")
-                        if 'return_reason' in all_returns.columns:
-                            reason_counts = all_returns['return_reason'].value_counts()
+                        if analysis['by_reason']:
+                            reason_counts = pd.Series(analysis['by_reason'])
                             st.bar_chart(reason_counts)
                     
                     # detailed statistics
                     st.subheader("Detailed Statistics")
                     
-                    if 'product' in all_returns.columns:
-                        product_stats = all_returns['product'].value_counts().reset_index()
-                        product_stats.columns = ['Product', 'Count']
-                        product_stats['Percentage'] = (product_stats['Count'] / len(all_returns) * 100).round(1)
+                    if analysis['by_product']:
+                        product_stats = pd.DataFrame(list(analysis['by_product'].items()), columns=['Product', 'Count'])
+                        product_stats['Percentage'] = (product_stats['Count'] / analysis['total_returns'] * 100).round(1)
                         st.dataframe(product_stats, use_container_width=True)
+
+                    # trends, read from the daily rollup
+                    st.subheader("Trends")
+                    col1, col2, col3, col4 = st.columns(4)
+                    with col1:
+                        period = st.selectbox("Period", ["week", "day", "month"], key="trend_period")
+                    with col2:
+                        breakdown = st.selectbox("Breakdown", ["All returns", "Store", "Product", "Reason"], key="trend_breakdown")
+                    with col3:
+                        window = st.selectbox("Range", ["Last year", "Last 90 days", "All"], key="trend_range")
+                    with col4:
+                        metric = st.selectbox("Show", ["Returns", "Cost"], key="trend_metric")
+
+                    trend = safe_handle_request("trend", {
+                        "period": period,
+                        "dimension": None if breakdown == "All returns" else breakdown.lower(),
+                        "last_days": {"Last year": 365, "Last 90 days": 90, "All": None}[window],
+                    })
+                    if isinstance(trend, dict) and "Error" in trend:
+                        st.warning(f"Trends unavailable: {trend['Error']}")
+                    elif trend and trend['rows']:
+                        trend_df = pd.DataFrame(trend['rows'])
+                        value = metric.lower()
+                        if trend['dimension']:
+                            chart = trend_df.pivot(index='period', columns='value', values=value).fillna(0)
+                        else:
+                            chart = trend_df.set_index('period')[[value]]
+                        st.line_chart(chart)
+                        st.caption(f"{trend['date_from']} to {trend['date_to']}, per {period}")
+                    else:
+                        st.info("No dated returns for trends")
                 else:
                     st.info("No data available for statistics")
             except Exception as e:
@@ -274,13 +442,20 @@ def main():
             with col2:
                 st.write("")
                 st.write("")  
-                if st.button("Generate Report", type="primary"):
+                background = st.checkbox("Run in background", value=True, help="Queue the report and keep using the app while it is written")
+                if background and st.button("Submit Report Job", type="primary"):
+                    result = safe_handle_request("report_submit", report_name)
+                    if result and result.get('success'):
+                        st.session_state.report_job = {"job_id": result['job_id'], "file": report_name}
+                if not background and st.button("Generate Report", type="primary"):
                     with st.spinner("Generating report..."):
                         try:
                             result = safe_handle_request("report", report_name)
                             
                             if result and result.get('success'):
                                 st.success(f"Successfully Generated Report: {report_name}")
+                                if result.get('cached'):
+                                    st.caption("Data unchanged since the last report, reused the cached workbook")
                                 
                                 # 顯示摘要
                                 st.subheader("Report Summary")
@@ -311,6 +486,40 @@ def main():
                                 st.error(f"Report generation failed: {error_msg}")
                         except Exception as e:
                             st.error(f"Error generating report: {str(e)}")
+            
+            # background job status
+            report_job = st.session_state.get('report_job')
+            if report_job:
+                status = safe_handle_request("report_status", report_job['job_id'])
+                if isinstance(status, dict) and 'state' in status:
+                    st.subheader(f"Report job {status['job_id']}: {status['state']}")
+                    if status['state'] in ("queued", "running"):
+                        st.progress(status['progress'], text=status['message'] or status['state'])
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            if st.button("Refresh Status"):
+                                st.rerun()
+                        with col2:
+                            if st.button("Cancel Job"):
+                                safe_handle_request("report_cancel", report_job['job_id'])
+                                st.rerun()
+                    elif status['state'] == "done":
+                        result = safe_handle_request("report_result", report_job['job_id'])
+                        st.success(f"Report ready in {status['elapsed_sec']:.1f}s: {result['file']}")
+                        try:
+                            with open(result['file'], 'rb') as f:
+                                st.download_button(
+                                    label="Download Excel Report",
+                                    data=f,
+                                    file_name=os.path.basename(result['file']),
+                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                                )
+                        except Exception as e:
+                            st.error(f"Error creating download: {str(e)}")
+                    else:
+                        st.error(f"Report job {status['state']}: {status['error'] or ''}")
+                else:
+                    st.session_state.report_job = None
         else:
             st.warning("Please load data first")
     
@@ -0,0 +1,238 @@
+"""
+Parser microbenchmark: parses per second of the legacy regex cascade vs ReturnParser
+
+run from the repo root:  python -m benchmarks.bench_parser [--n 20000]
+"""
+import argparse
+import json
+import re
+import time
+from datetime import datetime
+
+from Parser import ReturnParser
+from Retrieval import PARSED_FIELDS
+
+COLUMNS = ['id', 'order_id', 'product', 'category', 'return_reason', 'cost', 'approved_flag', 'store_name', 'date']
+
+SAMPLE_INPUTS = [
+    "order: 2100 product: Tablet category: Electronics reason: Missing Accessories cost: $277 approved: Yes store: Sunnyvale Town date: 2025-01-18",
+    "Return 1234 product:Laptop reason:Defective $599 at Brooklyn Center 2025-01-15",
+    "order: 1500 product: Tablet reason: defective category: Electronics approved: Yes cost: $300 store: Brooklyn Center date: 2025-07-18",
+    "order_id : 9876 product : Smart Watch return_reason: Wrong Size price: 199.99 store_name: Riverdale Outlet date: 01/03/2025 status: pending",
+    "id:4321 because: damaged on arrival 45 dollars from Greenfield Center 1/3/2025 approved: false",
+    "customer paid: 1999 for a keyboard, no other details",
+]
+
+
+def legacy_parse(text, available_columns):
+    """
+    the analyze_input body before the parser engine, kept as the baseline
+    """
+    analyzed_data = {}
+    
+    # order_id
+    order_patterns = [
+        r'order[_\s]*id\s*:\s*(\d+)',  # order_id: 123, order_id:123
+        r'order\s*:\s*(\d+)',          # order: 123, order:123, order :123, order : 123
+        r'id\s*:\s*(\d+)',             # id: 123, id:123, id :123, id : 123
+        r'(\d{4,})'                    # 數字
+    ]
+    
+    order_id = None
+    for pattern in order_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            order_id = match.group(1)
+            break
+    
+    if 'order_id' in available_columns:
+        analyzed_data['order_id'] = order_id if order_id else None
+    
+    # product 
+    product_patterns = [
+        r'product\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',     # product: Laptop, product:Laptop, product :Laptop, product : Laptop
+    ]
+    
+    product_value = None
+    for pattern in product_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            product_value = match.group(1).strip().title()  # 大小寫
+            break
+    
+    if product_value:
+        if 'product_name' in available_columns:
+            analyzed_data['product_name'] = product_value
+        elif 'product' in available_columns:
+            analyzed_data['product'] = product_value
+    
+    # return_reason 
+    if 'return_reason' in available_columns:
+        reason = None
+        
+        # 優先使用模式匹配
+        reason_patterns = [
+            r'reason\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',      # reason: Defective, reason:Defective, reason :Defective, reason : Defective
+            r'because\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',     # because: defective, because:defective, because :defective, because : defective
+            r'return_reason\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)', # return_reason: Missing Accessories, return_reason:Missing Accessories, return_reason :Missing Accessories, return_reason : Missing Accessories
+        ]
+        
+        for pattern in reason_patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                reason = match.group(1).strip().title()
+                break
+        
+
+        
+        analyzed_data['return_reason'] = reason
+    
+    # date 
+    if 'date' in available_columns:
+        date_patterns = [
+            r'date\s*:\s*(\d{4}-\d{2}-\d{2})', # date: 2025-01-03, date:2025-01-03, date :2025-01-03, date : 2025-01-03
+            r'date\s*:\s*(\d{2}/\d{2}/\d{4})', # date: 01/03/2025, date:01/03/2025, date :01/03/2025, date : 01/03/2025
+            r'(\d{4}-\d{2}-\d{2})',           # 2025-01-03
+            r'(\d{2}/\d{2}/\d{4})',           # 01/03/2025
+            r'(\d{1,2}/\d{1,2}/\d{4})',       # 1/3/2025
+        ]
+        
+        extracted_date = None
+        for pattern in date_patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                date_str = match.group(1)
+                # 標準化日期格式為 YYYY-MM-DD
+                if '/' in date_str:
+                    if len(date_str.split('/')[2]) == 4:  # MM/DD/YYYY
+                        month, day, year = date_str.split('/')
+                        extracted_date = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+                else:
+                    extracted_date = date_str  # 已經是 YYYY-MM-DD 格式
+                break
+        
+        analyzed_data['date'] = extracted_date if extracted_date else datetime.now().strftime("%Y-%m-%d")
+    
+    # cost 
+    if 'cost' in available_columns:
+        cost_patterns = [
+            r'cost\s*:\s*\$?(\d+\.?\d*)',       # cost: $128, cost:$128, cost :$128, cost : $128
+            r'price\s*:\s*\$?(\d+\.?\d*)',      # price: $128, price:$128, price :$128, price : $128
+            r'\$(\d+\.?\d*)',                   # $128
+            r'(\d+\.?\d*)\s*dollars?',          # 128 dollars
+        ]
+        
+        cost_value = None
+        for pattern in cost_patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                cost_value = float(match.group(1))
+                break
+        
+        analyzed_data['cost'] = cost_value
+    
+    # store_name 
+    if 'store_name' in available_columns:
+        store_patterns = [
+            r'store\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',       # store: Brooklyn Center, store:Brooklyn Center, store :Brooklyn Center, store : Brooklyn Center
+            r'store_name\s*:\s*([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',  # store_name: Sunnyvale Town, store_name:Sunnyvale Town, store_name :Sunnyvale Town, store_name : Sunnyvale Town
+            r'at\s+([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',              # at Brooklyn Center
+            r'from\s+([A-Za-z\s]+?)(?:\s+\w+\s*:|$)',            # from Riverdale Outlet
+        ]
+        
+        store_value = None
+        for pattern in store_patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                store_value = match.group(1).strip().title()
+                break
+        
+        analyzed_data['store_name'] = store_value
+    
+    # category 
+    if 'category' in available_columns:
+        category_patterns = [
+            r'category\s*:\s*([A-Za-z]+)(?:\s+\w+\s*:|$)',      # category: Electronics, category:Electronics, category :Electronics, category : Electronics
+        ]
+        
+        category_value = None
+        for pattern in category_patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                category_value = match.group(1).strip().title()
+                break
+        
+        analyzed_data['category'] = category_value
+    
+    # approved_flag 
+    if 'approved_flag' in available_columns:
+        approval_patterns = [
+            r'approved\s*:\s*(yes|no|true|false)',     # approved: yes, approved:yes, approved :yes, approved : yes
+            r'status\s*:\s*(approved|rejected|pending)', # status: approved, status:approved, status :approved, status : approved
+            r'approved_flag\s*:\s*(yes|no)',           # approved_flag: yes, approved_flag:yes, approved_flag :yes, approved_flag : yes
+        ]
+        
+        approval_value = "No"  # 預設值
+        for pattern in approval_patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                status = match.group(1).lower()
+                if status in ['yes', 'true', 'approved']:
+                    approval_value = "Yes"
+                elif status in ['no', 'false', 'rejected']:
+                    approval_value = "No"
+                elif status == 'pending':
+                    approval_value = "Pending"
+                break
+        
+        analyzed_data['approved_flag'] = approval_value
+    
+    return analyzed_data
+
+
+def new_parse(parser, text, available_columns):
+    """
+    the current analyze_input logic on top of ReturnParser
+    """
+    fields = [field for field in PARSED_FIELDS if field == 'product' or field in available_columns]
+    analyzed_data = {}
+    for field, value in parser.parse(text, fields).items():
+        if field == 'product':
+            if value:
+                if 'product_name' in available_columns:
+                    analyzed_data['product_name'] = value
+                elif 'product' in available_columns:
+                    analyzed_data['product'] = value
+        else:
+            analyzed_data[field] = value
+    return analyzed_data
+
+
+def run(n):
+    parser = ReturnParser()
+
+    # both engines must agree before their speed is worth comparing
+    for text in SAMPLE_INPUTS:
+        before, after = legacy_parse(text, COLUMNS), new_parse(parser, text, COLUMNS)
+        if before != after:
+            raise AssertionError(f"parser mismatch for {text!r}: {before} != {after}")
+
+    texts = [SAMPLE_INPUTS[i % len(SAMPLE_INPUTS)] for i in range(n)]
+    results = {}
+    for name, parse in (("before", lambda t: legacy_parse(t, COLUMNS)),
+                        ("after", lambda t: new_parse(parser, t, COLUMNS))):
+        start = time.perf_counter()
+        for text in texts:
+            parse(text)
+        elapsed = time.perf_counter() - start
+        results[name] = {"parses_per_sec": round(n / elapsed, 1), "seconds": round(elapsed, 4)}
+
+    results["speedup"] = round(results["after"]["parses_per_sec"] / results["before"]["parses_per_sec"], 2)
+    return results
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--n", type=int, default=20000, help="number of parses per engine")
+    args = arg_parser.parse_args()
+    print(json.dumps(run(args.n), indent=2))
@@ -0,0 +1,165 @@
+"""
+Start-up cost of a fresh process: import time (-X importtime) and wall time of short jobs
+
+run from the repo root:
+    python -m benchmarks.bench_startup --output startup.json
+    python -m benchmarks.bench_startup --baseline startup.json
+
+Scenarios run in a new interpreter each time (the median of --repeat runs is kept):
+import_controller, insert (Controller + one insert), aggregate (Controller + one aggregate)
+and main_help. Every scenario also lists which heavy modules (pandas, openpyxl, numpy)
+it loaded. With --baseline, a scenario more than --tolerance slower is listed under
+"regressions" and the exit code is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_suite import _git_revision
+from benchmarks.generate import write_csv
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("pandas", "openpyxl", "numpy")
+
+# each prints the heavy modules it ended up importing as its last line
+REPORT_MODULES = f"import json, sys; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+SCENARIOS = {
+    "import_controller": "import Controller\n" + REPORT_MODULES,
+    "insert": (
+        "from Controller import Controller\n"
+        "c = Controller()\n"
+        "assert c.handle_request('insert', 'order: 1 product: Laptop reason: Defective cost: $900 store: SoMa Market').get('success')\n"
+        "c.close()\n" + REPORT_MODULES
+    ),
+    "aggregate": (
+        "from Controller import Controller\n"
+        "c = Controller()\n"
+        "assert c.handle_request('aggregate').get('total_returns')\n"
+        "c.close()\n" + REPORT_MODULES
+    ),
+}
+
+
+def _env():
+    return dict(os.environ, PYTHONPATH=REPO + os.pathsep + os.environ.get("PYTHONPATH", ""))
+
+
+def run_scenario(args, workdir, repeat):
+    """median wall seconds of `python <args>` and the heavy modules it imported"""
+    samples = []
+    modules = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        done = subprocess.run([sys.executable] + args, cwd=workdir, env=_env(), capture_output=True, text=True)
+        samples.append(time.perf_counter() - start)
+        if done.returncode != 0:
+            return {"error": done.stderr.strip().splitlines()[-1] if done.stderr.strip() else f"exit {done.returncode}"}
+        last = done.stdout.strip().splitlines()[-1] if done.stdout.strip() else ""
+        modules = json.loads(last) if last.startswith("[") else None
+    result = {"seconds": round(statistics.median(samples), 4), "min_seconds": round(min(samples), 4)}
+    if modules is not None:
+        result["heavy_modules"] = modules
+    return result
+
+
+def import_times(module, workdir, repeat, top=15):
+    """
+    -X importtime of `import module`: its cumulative time (median, ms) and the slowest imports by self time
+    """
+    totals = []
+    for _ in range(repeat):
+        done = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              cwd=workdir, env=_env(), capture_output=True, text=True)
+        entries = []
+        for line in done.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith("import time:") or "imported package" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            entries.append((int(self_us), int(cumulative_us), name.rstrip()))
+        totals.append(next(cumulative for _, cumulative, name in entries if name.strip() == module))
+
+    slowest = sorted(entries, reverse=True)[:top]
+    return {
+        "module": module,
+        "cumulative_ms": round(statistics.median(totals) / 1000, 2),
+        "modules_imported": len(entries),
+        "heavy_modules": sorted({name.strip().split(".")[0] for _, _, name in entries} & set(HEAVY_MODULES)),
+        "slowest_self_ms": [{"module": name.strip(), "self_ms": round(self_us / 1000, 2),
+                             "cumulative_ms": round(cumulative_us / 1000, 2)}
+                            for self_us, cumulative_us, name in slowest],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """scenarios more than tolerance slower than the baseline"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("scenarios", {}).get(name, {}).get("seconds")
+        after = result.get("seconds")
+        if before and after is not None and after > before * (1 + tolerance):
+            regressions.append({"scenario": name, "baseline": before, "current": after,
+                                "change": round(after / before - 1, 4)})
+    return regressions
+
+
+def run(repeat=5, baseline=None, tolerance=0.25):
+    workdir = tempfile.mkdtemp(prefix="returns_startup_")
+    try:
+        # a small database in the scenarios' working directory (ReturnsData.db)
+        from Retrieval import RetrievalAgent
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent = RetrievalAgent(db_path=os.path.join(workdir, "ReturnsData.db"))
+            agent.load_csv(write_csv(os.path.join(workdir, "returns.csv"), 1000))
+            agent.close()
+
+        scenarios = {name: run_scenario(["-c", code], workdir, repeat) for name, code in SCENARIOS.items()}
+        scenarios["main_help"] = run_scenario([os.path.join(REPO, "main.py"), "--help"], workdir, repeat)
+        # the interpreter alone, for reference
+        scenarios["python"] = run_scenario(["-c", "pass"], workdir, repeat)
+
+        output = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "git": _git_revision(),
+                "python": sys.version.split()[0],
+                "repeat": repeat,
+            },
+            "importtime": import_times("Controller", workdir, repeat),
+            "scenarios": scenarios,
+        }
+        if baseline is not None:
+            output["regressions"] = compare(scenarios, baseline, tolerance)
+        return output
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--repeat", type=int, default=5, help="runs per scenario")
+    arg_parser.add_argument("--output", help="also write the JSON to this file")
+    arg_parser.add_argument("--baseline", help="JSON of an earlier run to compare against")
+    arg_parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slow-down vs the baseline")
+    args = arg_parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    output = run(args.repeat, baseline, args.tolerance)
+    text = json.dumps(output, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.exit(1 if output.get("regressions") else 0)
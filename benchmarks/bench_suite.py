@@ -0,0 +1,281 @@
+"""
+End-to-end benchmarks on generated data: load_csv, analyze_input, insert_return,
+get_all_returns, iter_returns, trend (weekly, last year, from the daily rollup),
+create_report (pandas) and create_report_streaming
+
+run from the repo root:
+    python -m benchmarks.bench_suite --size 10k --output bench.json
+    python -m benchmarks.bench_suite --size 1m --only load_csv get_all_returns --baseline bench.json
+
+Every benchmark runs in a fresh process, so its peak RSS is its own.
+Results are JSON; with --baseline, a throughput drop beyond --tolerance is
+listed under "regressions" and the exit code is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.generate import SIZES, write_csv, nl_inputs
+
+BENCHMARKS = ("load_csv", "analyze_input", "insert_return", "get_all_returns", "iter_returns",
+              "trend", "create_report", "create_report_streaming")
+
+
+def peak_rss_mb():
+    """peak resident set size of this process, None where resource is missing"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def latency_stats(samples):
+    """percentiles (nearest rank) of per-call latencies (seconds) in ms"""
+    ordered = sorted(samples)
+    pick = lambda q: ordered[max(0, math.ceil(round(q * len(ordered), 9)) - 1)] * 1000
+    return {
+        "p50_ms": round(pick(0.50), 4),
+        "p90_ms": round(pick(0.90), 4),
+        "p99_ms": round(pick(0.99), 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4),
+    }
+
+
+def timed_calls(fn, items):
+    """call fn on every item, return (per-call seconds, total seconds)"""
+    samples = []
+    start = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - t)
+    return samples, time.perf_counter() - start
+
+
+def _agent(workdir, name):
+    """RetrievalAgent on a private copy of the loaded database"""
+    from Retrieval import RetrievalAgent
+    db_path = os.path.join(workdir, f"{name}.db")
+    shutil.copyfile(os.path.join(workdir, "template.db"), db_path)
+    return RetrievalAgent(db_path=db_path)
+
+
+def bench_load_csv(workdir, options):
+    from Retrieval import RetrievalAgent
+    # the loaded database is the template of the other benchmarks
+    agent = RetrievalAgent(db_path=os.path.join(workdir, "template.db"))
+    start = time.perf_counter()
+    result = agent.load_csv(options["csv"], chunk_size=options["chunk_size"])
+    elapsed = time.perf_counter() - start
+    agent.close()
+    if not result.get("success"):
+        raise RuntimeError(result.get("error"))
+    return {"rows": result["records"], "seconds": round(elapsed, 4), "throughput": round(result["records"] / elapsed, 1), "unit": "rows/s"}
+
+
+def bench_analyze_input(workdir, options):
+    agent = _agent(workdir, "analyze")
+    columns = agent.get_columns()
+    texts = nl_inputs(options["parses"], options["seed"])
+    samples, elapsed = timed_calls(lambda text: agent.analyze_input(text, columns), texts)
+    agent.close()
+    return dict(latency_stats(samples), calls=len(texts), seconds=round(elapsed, 4),
+                throughput=round(len(texts) / elapsed, 1), unit="parses/s")
+
+
+def bench_insert_return(workdir, options):
+    agent = _agent(workdir, "insert")
+    texts = nl_inputs(options["inserts"], options["seed"])
+    samples, elapsed = timed_calls(agent.insert_return, texts)
+    agent.close()
+    return dict(latency_stats(samples), calls=len(texts), seconds=round(elapsed, 4),
+                throughput=round(len(texts) / elapsed, 1), unit="inserts/s")
+
+
+def bench_get_all_returns(workdir, options):
+    agent = _agent(workdir, "query")
+    rows = agent.row_count()
+    samples, elapsed = timed_calls(lambda _: agent.get_all_returns(), range(options["repeat"]))
+    agent.close()
+    return dict(latency_stats(samples), rows=rows, calls=options["repeat"], seconds=round(elapsed, 4),
+                throughput=round(rows * options["repeat"] / elapsed, 1), unit="rows/s")
+
+
+def bench_iter_returns(workdir, options):
+    # every row once, as compact DataFrame chunks that are dropped after use
+    agent = _agent(workdir, "iter")
+    rows = agent.row_count()
+    samples, elapsed = timed_calls(lambda _: sum(len(chunk) for chunk in agent.iter_returns()), range(options["repeat"]))
+    agent.close()
+    return dict(latency_stats(samples), rows=rows, calls=options["repeat"], seconds=round(elapsed, 4),
+                throughput=round(rows * options["repeat"] / elapsed, 1), unit="rows/s")
+
+
+def bench_trend(workdir, options):
+    # returns per week for the last year, read from returns_daily
+    agent = _agent(workdir, "trend")
+    calls = options["repeat"] * 100
+    samples, elapsed = timed_calls(lambda _: agent.trend("week", last_days=365), range(calls))
+    agent.close()
+    return dict(latency_stats(samples), calls=calls, seconds=round(elapsed, 4),
+                throughput=round(calls / elapsed, 1), unit="queries/s")
+
+
+def bench_create_report(workdir, options):
+    from GenReport import ReportAgent
+    agent = _agent(workdir, "report")
+    data = agent.get_all_returns()
+    start = time.perf_counter()
+    result = ReportAgent().create_report(data, os.path.join(workdir, "report.xlsx"))
+    elapsed = time.perf_counter() - start
+    agent.close()
+    if not result.get("success"):
+        raise RuntimeError(result.get("error") or result.get("Error"))
+    return {"rows": len(data), "seconds": round(elapsed, 4), "throughput": round(len(data) / elapsed, 1), "unit": "rows/s"}
+
+
+def bench_create_report_streaming(workdir, options):
+    from GenReport import ReportAgent
+    agent = _agent(workdir, "report_streaming")
+    rows = agent.row_count()
+    start = time.perf_counter()
+    analysis = agent.aggregate_returns()
+    columns, chunks = agent.iter_rows()
+    result = ReportAgent().create_report_streaming(chunks, columns, analysis, os.path.join(workdir, "report_streaming.xlsx"))
+    elapsed = time.perf_counter() - start
+    agent.close()
+    if not result.get("success"):
+        raise RuntimeError(result.get("error") or result.get("Error"))
+    return {"rows": rows, "seconds": round(elapsed, 4), "throughput": round(rows / elapsed, 1), "unit": "rows/s"}
+
+
+def _child(name, workdir, options, results):
+    try:
+        # the agents print progress, keep the JSON output clean
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = globals()[f"bench_{name}"](workdir, options)
+        result["peak_rss_mb"] = peak_rss_mb()
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    results.put(result)
+
+
+def run_isolated(name, workdir, options):
+    """run one benchmark in a fresh process"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_child, args=(name, workdir, options, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """benchmarks whose throughput fell more than tolerance below the baseline"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("benchmarks", {}).get(name, {}).get("throughput")
+        after = result.get("throughput")
+        if before and after is not None and after < before * (1 - tolerance):
+            regressions.append({"benchmark": name, "baseline": before, "current": after,
+                                "change": round(after / before - 1, 4)})
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(options, only=None, baseline=None, tolerance=0.15):
+    names = [name for name in BENCHMARKS if not only or name in only]
+    workdir = tempfile.mkdtemp(prefix="returns_bench_")
+    try:
+        output = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "git": _git_revision(),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "options": dict(options),
+            },
+            "benchmarks": {},
+        }
+        if not options.get("csv"):
+            options = dict(options, csv=write_csv(os.path.join(workdir, "returns.csv"), options["rows"], options["seed"]))
+
+        # every other benchmark copies the database load_csv builds
+        results = {"load_csv": run_isolated("load_csv", workdir, options)}
+        for name in names:
+            if name != "load_csv":
+                results[name] = run_isolated(name, workdir, options)
+        output["benchmarks"] = {name: results[name] for name in names}
+
+        if baseline is not None:
+            output["regressions"] = compare(output["benchmarks"], baseline, tolerance)
+        return output
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--size", choices=sorted(SIZES), default="10k", help="generated row count preset")
+    arg_parser.add_argument("--rows", type=int, help="generated row count, overrides --size")
+    arg_parser.add_argument("--csv", help="benchmark this CSV instead of generated data")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--chunk-size", type=int, default=50000, help="load_csv chunk size (0: whole file)")
+    arg_parser.add_argument("--parses", type=int, default=20000, help="analyze_input calls")
+    arg_parser.add_argument("--inserts", type=int, default=1000, help="insert_return calls")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="get_all_returns / iter_returns calls (x100 trend queries)")
+    arg_parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="run only these benchmarks")
+    arg_parser.add_argument("--output", help="also write the JSON to this file")
+    arg_parser.add_argument("--baseline", help="JSON of an earlier run to compare against")
+    arg_parser.add_argument("--tolerance", type=float, default=0.15, help="allowed throughput drop vs the baseline")
+    args = arg_parser.parse_args()
+
+    options = {
+        "rows": args.rows or SIZES[args.size],
+        "csv": os.path.abspath(args.csv) if args.csv else None,
+        "seed": args.seed,
+        "chunk_size": args.chunk_size or None,
+        "parses": args.parses,
+        "inserts": args.inserts,
+        "repeat": args.repeat,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    output = run(options, args.only, baseline, args.tolerance)
+    text = json.dumps(output, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.exit(1 if output.get("regressions") else 0)
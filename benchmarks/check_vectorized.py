@@ -0,0 +1,130 @@
+"""
+Conformance check: RetrievalAgent.analyze_series (vectorized) against analyze_input, row for row
+
+run from the repo root:  python -m benchmarks.check_vectorized [--n 100000]
+
+Also inserts both results (insert_records / insert_frame) into two fresh databases
+and compares the stored rows. Prints timings as JSON, exit code 1 on any mismatch.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from Retrieval import RetrievalAgent
+from benchmarks.bench_parser import COLUMNS, SAMPLE_INPUTS
+from benchmarks.generate import nl_inputs, write_csv
+
+# older tables name the product column product_name
+LEGACY_COLUMNS = [col if col != 'product' else 'product_name' for col in COLUMNS]
+# tables with the date_day day number
+DATE_DAY_COLUMNS = COLUMNS + ['date_day']
+
+EDGE_INPUTS = [
+    "",
+    "   ",
+    "hello there",
+    "ORDER: 77 PRODUCT: GAMING MOUSE REASON: WRONG ITEM STORE: SOMA MARKET APPROVED: TRUE",
+    "order:5 product:tablet cost:$12. date:2/3/2024",
+    "order_id:12 order: 13 id: 14 cost: 5 price: 6 $7 8 dollars",
+    "date: 12/31/2024 date: 2025-01-01",
+    "status: PENDING approved_flag: yes",
+    "product: Crème Brûlée reason: too sweet",   # non-ASCII, parsed one by one
+    "İd: 5555 prodUct: ſmart watch",
+    "Return 1234 product:Laptop reason:Defective $599 at Brooklyn Center 2025-01-15\nsecond line",
+    "order: 88 reason: late product :   ",      # empty product: left out on both paths
+    "order: 89 product:\t store: Soma",
+]
+
+
+def _normalize(record):
+    """drop missing values, NaN, NA and None alike"""
+    return {key: value for key, value in record.items()
+            if value is not None and value is not pd.NA and not (isinstance(value, float) and math.isnan(value))}
+
+
+def compare(agent, texts, columns):
+    """(mismatches, scalar seconds, vectorized seconds)"""
+    start = time.perf_counter()
+    scalar = [agent.analyze_input(text, columns) for text in texts]
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frame = agent.analyze_series(pd.Series(texts), columns)
+    vectorized_seconds = time.perf_counter() - start
+
+    mismatches = []
+    for text, expected, row in zip(texts, scalar, frame.to_dict("records")):
+        if _normalize(expected) != _normalize(row):
+            mismatches.append({"input": text, "analyze_input": expected, "analyze_series": row})
+    if len(frame) != len(texts):
+        mismatches.append({"error": f"{len(frame)} rows for {len(texts)} inputs"})
+    return mismatches, scalar_seconds, vectorized_seconds
+
+
+def compare_inserts(workdir, texts):
+    """rows stored by insert_records vs insert_frame, as lists"""
+    csv_path = write_csv(os.path.join(workdir, "seed.csv"), 10)
+    stored = []
+    for name in ("records", "frame"):
+        agent = RetrievalAgent(db_path=os.path.join(workdir, f"{name}.db"))
+        agent.load_csv(csv_path)
+        columns = agent.get_columns()
+        if name == "records":
+            agent.insert_records([agent.analyze_input(text, columns) for text in texts])
+        else:
+            agent.insert_frame(agent.analyze_series(pd.Series(texts), columns))
+        with agent.db.reader() as conn:
+            stored.append(conn.execute(
+                "SELECT order_id, product, category, return_reason, cost, approved_flag, store_name, date, date_day "
+                "FROM returns ORDER BY id").fetchall())
+        agent.close()
+    return [{"records": a, "frame": b} for a, b in zip(*stored) if a != b]
+
+
+def run(n, seed=0):
+    workdir = tempfile.mkdtemp(prefix="returns_conformance_")
+    try:
+        # analyze_input is given the columns, the database is only used by compare_inserts
+        agent = RetrievalAgent(db_path=os.path.join(workdir, "unused.db"))
+        texts = SAMPLE_INPUTS + EDGE_INPUTS + nl_inputs(n, seed)
+        output = {"inputs": len(texts), "checks": {}}
+        failed = False
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, columns in (("columns", COLUMNS), ("legacy_columns", LEGACY_COLUMNS),
+                                  ("date_day_columns", DATE_DAY_COLUMNS)):
+                mismatches, scalar_seconds, vectorized_seconds = compare(agent, texts, columns)
+                output["checks"][name] = {
+                    "mismatches": len(mismatches),
+                    "examples": mismatches[:5],
+                    "analyze_input_per_sec": round(len(texts) / scalar_seconds, 1),
+                    "analyze_series_per_sec": round(len(texts) / vectorized_seconds, 1),
+                    "speedup": round(scalar_seconds / vectorized_seconds, 2),
+                }
+                failed = failed or bool(mismatches)
+            agent.close()
+
+            stored = compare_inserts(workdir, texts[:2000])
+        output["checks"]["stored_rows"] = {"mismatches": len(stored), "examples": stored[:5]}
+        output["success"] = not (failed or stored)
+        return output
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--n", type=int, default=100000, help="generated inputs on top of the fixed samples")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+    result = run(args.n, args.seed)
+    print(json.dumps(result, indent=2, ensure_ascii=False, default=str))
+    sys.exit(0 if result["success"] else 1)
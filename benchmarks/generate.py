@@ -0,0 +1,147 @@
+"""
+Seeded synthetic returns data in the sample.csv schema, for benchmarks
+
+run from the repo root:
+    python -m benchmarks.generate --size 1m --out returns_1m.csv
+    python -m benchmarks.generate --rows 50000 --out returns.csv --nl 10000 --nl-out inserts.txt
+
+The same seed and size always give the same file.
+"""
+import argparse
+import csv
+import json
+import random
+from datetime import date, timedelta
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+FIELDNAMES = ['order_id', 'product', 'category', 'return_reason', 'cost', 'approved_flag', 'store_name', 'date']
+
+# product -> (category, cost min, cost max, weight), taken from sample.csv
+PRODUCTS = {
+    'Bluetooth Speaker': ('Electronics', 73, 90, 5),
+    'Camera': ('Electronics', 561, 728, 15),
+    'Charger': ('Accessories', 21, 28, 16),
+    'Headphones': ('Electronics', 104, 136, 14),
+    'Keyboard': ('Accessories', 41, 51, 10),
+    'Laptop': ('Electronics', 808, 1030, 7),
+    'Mouse': ('Accessories', 22, 28, 6),
+    'Phone Case': ('Accessories', 13, 15, 6),
+    'Smartwatch': ('Electronics', 170, 223, 7),
+    'Tablet': ('Electronics', 260, 342, 14),
+}
+
+# value -> weight, taken from sample.csv
+RETURN_REASONS = {
+    'Missing Accessories': 18, 'Not Compatible': 13, 'Broken Screen': 11, 'Damaged on Arrival': 10,
+    'Changed Mind': 10, 'Warranty Claim': 9, 'Performance Issues': 9, 'Battery Issue': 9,
+    'Defective': 7, 'Wrong Item Shipped': 4,
+}
+STORES = {
+    'SoMa Market': 16, 'Sunnyvale Town': 12, 'Harbor Point': 11, 'Brooklyn Center': 10,
+    'Greenfield Center': 10, 'Lakeside Mall': 10, 'Riverdale Outlet': 9, 'Bayview Plaza': 9,
+    'Capitol Plaza': 8, 'Midtown Hub': 5,
+}
+APPROVED = {'Yes': 55, 'No': 45}
+
+FIRST_ORDER_ID = 1001
+FIRST_DATE = date(2024, 1, 1)
+DAYS = 731  # two years
+
+# natural language insert formats: explicit "key: value" input and free-form input that
+# analyze_input only partly understands (like README example #2)
+NL_TEMPLATES = [
+    "order: {order_id} product: {product} category: {category} reason: {return_reason} cost: ${cost} "
+    "approved: {approved_flag} store: {store_name} date: {date}",
+    "Return {order_id} product:{product} reason:{return_reason} ${cost} at {store_name} {date}",
+    "order_id : {order_id} product : {product} return_reason: {return_reason} price: {cost} "
+    "store_name: {store_name} date: {us_date} status: {status}",
+    "id:{order_id} category: {category} because: {return_reason} {cost} dollars from {store_name} {us_date}",
+]
+
+
+def _picker(rng, weights):
+    values = list(weights)
+    cumulative = []
+    total = 0
+    for value in values:
+        total += weights[value]
+        cumulative.append(total)
+    return lambda: rng.choices(values, cum_weights=cumulative)[0]
+
+
+def generate_rows(n, seed=0, first_order_id=FIRST_ORDER_ID):
+    """
+    yield n row dicts (FIELDNAMES), order_id is unique and increasing
+    """
+    rng = random.Random(seed)
+    product = _picker(rng, {name: spec[3] for name, spec in PRODUCTS.items()})
+    reason = _picker(rng, RETURN_REASONS)
+    store = _picker(rng, STORES)
+    approved = _picker(rng, APPROVED)
+    dates = [(FIRST_DATE + timedelta(days=day)).isoformat() for day in range(DAYS)]
+
+    for i in range(n):
+        name = product()
+        category, low, high, _ = PRODUCTS[name]
+        yield {
+            'order_id': first_order_id + i,
+            'product': name,
+            'category': category,
+            'return_reason': reason(),
+            'cost': rng.randint(low, high),
+            'approved_flag': approved(),
+            'store_name': store(),
+            'date': dates[rng.randrange(DAYS)],
+        }
+
+
+def write_csv(path, n, seed=0):
+    """
+    write n rows to a CSV file, streamed (10M rows need no more memory than 10k)
+    """
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(generate_rows(n, seed))
+    return path
+
+
+def nl_inputs(n, seed=0, first_order_id=None):
+    """
+    n natural language insert strings; order ids continue after the CSV rows by default
+    """
+    rng = random.Random(seed + 1)
+    if first_order_id is None:
+        first_order_id = 10 ** 8
+    texts = []
+    for row in generate_rows(n, seed + 1, first_order_id):
+        year, month, day = row['date'].split('-')
+        row['us_date'] = f"{int(month)}/{int(day)}/{year}"
+        row['status'] = 'approved' if row['approved_flag'] == 'Yes' else 'rejected'
+        texts.append(rng.choice(NL_TEMPLATES).format(**row))
+    return texts
+
+
+def write_nl(path, n, seed=0):
+    with open(path, 'w', encoding='utf-8') as f:
+        for text in nl_inputs(n, seed):
+            f.write(text + "\n")
+    return path
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--size", choices=sorted(SIZES), default="10k", help="preset row count")
+    arg_parser.add_argument("--rows", type=int, help="row count, overrides --size")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--out", default="returns_generated.csv", help="CSV output path")
+    arg_parser.add_argument("--nl", type=int, default=0, help="also write this many natural language inserts")
+    arg_parser.add_argument("--nl-out", default="inserts_generated.txt", help="natural language output path (one per line)")
+    args = arg_parser.parse_args()
+
+    rows = args.rows or SIZES[args.size]
+    output = {"csv": write_csv(args.out, rows, args.seed), "rows": rows, "seed": args.seed}
+    if args.nl:
+        output.update({"nl": write_nl(args.nl_out, args.nl, args.seed), "nl_rows": args.nl})
+    print(json.dumps(output, indent=2))
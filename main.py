@@ -1,5 +1,5 @@
+import argparse
 import os
-import pandas as pd
 from Controller import Controller
 
 def demo():
@@ -45,7 +45,7 @@ def demo():
             if isinstance(result, dict) and "Error" in result:
                 print(f"Insert failed: {result['Error']}")
             else:
-                print(f"Insert success, now have {len(result)} records")
+                print(f"Insert success (id {result['id']}), now have {result['records']} records")
         
         # step 3. query all records
         print("\nStep 3. query all records")
@@ -76,5 +76,39 @@ def demo():
     finally:
         controller.close()
         
+def import_nl(args):
+    """
+    bulk import a natural language log file: python main.py import stores_0105.txt
+    """
+    controller = Controller()
+    try:
+        result = controller.handle_request("import_nl", {
+            "path": args.path,
+            "format": args.format,
+            "reject_file": args.rejects,
+            "workers": args.workers,
+        })
+        if result.get("success"):
+            print(f"Imported {result['inserted']} of {result['lines']} lines "
+                  f"({result['rate_per_sec']} lines/s, {result['workers']} workers), now have {result['records']} records")
+            if result['rejected']:
+                print(f"  {result['rejected']} rejected, see {result['reject_file']}")
+        else:
+            print(f"Import failed: {result.get('error') or result.get('Error')}")
+    finally:
+        controller.close()
+
 if __name__ == "__main__":
-    demo()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Returns & Warranty System, interactive demo without a command")
+    commands = arg_parser.add_subparsers(dest="command")
+    import_parser = commands.add_parser("import", help="bulk import natural language returns, one per line")
+    import_parser.add_argument("path", help="text or JSONL file")
+    import_parser.add_argument("--format", choices=["auto", "text", "jsonl"], default="auto", help="auto: by extension (.jsonl / .ndjson)")
+    import_parser.add_argument("--rejects", help="reject file (default: <path>.rejects.jsonl)")
+    import_parser.add_argument("--workers", type=int, help="parser processes (default: CPU count)")
+    args = arg_parser.parse_args()
+    
+    if args.command == "import":
+        import_nl(args)
+    else:
+        demo()
\ No newline at end of file